@@ -0,0 +1,157 @@
+"""Time fetching every feed one after another against subway_client.fetch_all.
+
+Requests to the MTA API are sent to a stub server on localhost instead, which
+waits a set time before answering each feed:
+
+    PYTHONPATH=src python benchmarks/fetch_feeds.py [--delays 0.2 0.3 0.4 0.3]
+
+A last run trickles one feed out slowly, so its request outlives the timeout
+of two cycles in a row without any single read timing out. The second cycle
+waits on the first one's request again rather than starting another.
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict
+from urllib.parse import urlsplit
+
+import requests
+from google.transit import gtfs_realtime_pb2
+from requests.adapters import HTTPAdapter
+
+import subway_client
+from subway_client.session import feed_name
+
+MTA_API = "https://api-endpoint.mta.info/"
+
+# feed name -> seconds the stub waits before answering it
+delays: Dict[str, float] = {}
+
+# feed name -> seconds the stub takes to send the body, a piece at a time
+trickles: Dict[str, float] = {}
+
+TRICKLE_PIECES = 10
+
+
+def feed_body(routes: Dict[str, str]) -> bytes:
+    """Build a small GTFS-realtime feed with a few departures per stop."""
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.header.gtfs_realtime_version = "2.0"
+    feed.header.timestamp = int(time.time())
+    for route_id, stop_id in routes.items():
+        for trip in range(20):
+            entity = feed.entity.add(id=f"{route_id}-{trip}")
+            entity.trip_update.trip.route_id = route_id
+            for direction in subway_client.DIRECTIONS:
+                update = entity.trip_update.stop_time_update.add()
+                update.stop_id = stop_id + direction
+                update.departure.time = int(time.time()) + 120 * trip
+    return feed.SerializeToString()
+
+
+BODIES = {
+    **{
+        feed_name(url): feed_body(routes) for url, routes in subway_client.STOPS.items()
+    },
+    feed_name(subway_client.STATUS_URL): json.dumps({"entity": []}).encode(),
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        name = feed_name(self.path)
+        time.sleep(delays.get(name, 0.0))
+        body = BODIES[name]
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        piece = -(-len(body) // TRICKLE_PIECES)
+        for start in range(0, len(body), piece):
+            self.wfile.write(body[start : start + piece])
+            self.wfile.flush()
+            time.sleep(trickles.get(name, 0.0) / TRICKLE_PIECES)
+
+    def log_message(self, *args: object) -> None:
+        pass
+
+
+class StubAdapter(HTTPAdapter):
+    """Send requests for the MTA API to the stub server instead."""
+
+    def __init__(self, base_url: str) -> None:
+        super().__init__()
+        self.base_url = base_url
+
+    def send(  # type: ignore[override]
+        self, request: requests.PreparedRequest, **kwargs: object
+    ) -> requests.Response:
+        request.url = self.base_url + urlsplit(request.url or "").path
+        return super().send(request, **kwargs)  # type: ignore[arg-type]
+
+
+def start_stub() -> None:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    subway_client.session.session.mount(MTA_API, StubAdapter(base_url))
+
+
+def fetch_sequentially() -> None:
+    feeds = {url: subway_client.fetch_subway_data(url) for url in subway_client.FEEDS}
+    subway_client.get_subway_times(feeds)
+    subway_client.fetch_status_data()
+
+
+def timed(function: Callable[[], object]) -> float:
+    started = time.perf_counter()
+    try:
+        function()
+    except (TimeoutError, requests.RequestException):
+        pass
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--delays",
+        type=float,
+        nargs=len(BODIES),
+        default=[0.2, 0.3, 0.4, 0.3],
+        metavar="SECONDS",
+        help="delay for the 123, BDFM, NQRW and alerts feeds",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    start_stub()
+    delays.update(zip(BODIES, args.delays))
+    print(f"delays: {delays}")
+
+    # connect once up front, so every run reuses the same connections
+    timed(subway_client.fetch_all)
+    sequential = min(timed(fetch_sequentially) for _ in range(args.repeat))
+    parallel = min(timed(subway_client.fetch_all) for _ in range(args.repeat))
+    print(f"sequential  {sequential:6.3f}s")
+    print(f"fetch_all   {parallel:6.3f}s  (slowest feed {max(args.delays):.3f}s)")
+
+    # the trickled feed's request outlives two cycles with a 1s timeout
+    stalled = feed_name(subway_client.FEED_NQRW)
+    trickles[stalled] = 2.5
+    for cycle in (1, 2):
+        seconds = timed(lambda: subway_client.fetch_all(timeout=1))
+        print(f"{stalled} trickling, cycle {cycle}  {seconds:6.3f}s")
+    trickles[stalled] = 0.0
+    time.sleep(1.0)
+    seconds = timed(lambda: subway_client.fetch_all(timeout=1))
+    print(f"after the trickle          {seconds:6.3f}s")
+    print(f"{stalled} stats: {subway_client.get_feed_stats()[subway_client.FEED_NQRW]}")
+
+
+if __name__ == "__main__":
+    main()
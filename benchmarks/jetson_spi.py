@@ -0,0 +1,133 @@
+"""Time sending one frame through the Jetson Nano's software SPI, with and
+without spi_bulk.so.
+
+Builds a stand-in for sysfs_software_spi.so that counts the bytes it is sent
+instead of clocking them out, and spi_bulk.c, into a temporary directory with
+gcc, then sends a frame through JetsonNano.spi_writebyte2 both ways and counts
+the calls made from Python into C:
+
+    PYTHONPATH=src python benchmarks/jetson_spi.py [--repeat 5]
+
+Jetson.GPIO is replaced by a stub, since only the SPI path is timed.
+"""
+
+import argparse
+import ctypes
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+import types
+from typing import Callable, List, Tuple
+
+from display_connector import epdconfig, spi_bulk
+
+FRAME_BYTES = 800 * 480 // 2
+
+MOCK_SPI = r"""
+#include <stdint.h>
+
+unsigned long bytes_sent = 0;
+uint8_t checksum = 0;
+
+void SYSFS_software_spi_begin(void) {}
+void SYSFS_software_spi_end(void) {}
+
+uint8_t SYSFS_software_spi_transfer(uint8_t data)
+{
+    bytes_sent++;
+    checksum ^= data;
+    return 0;
+}
+"""
+
+
+def build(directory: str) -> None:
+    """Build the stand-in library and the shim into a directory."""
+    mock_source = os.path.join(directory, "sysfs_software_spi.c")
+    with open(mock_source, "w") as f:
+        f.write(MOCK_SPI)
+    subprocess.run(
+        ["gcc", "-O2", "-shared", "-fPIC", "-o", "sysfs_software_spi.so", mock_source],
+        cwd=directory,
+        check=True,
+    )
+    spi_bulk.build(directory)
+
+
+def jetson(library_dirs: List[str]) -> epdconfig.JetsonNano:
+    class Jetson(epdconfig.JetsonNano):
+        LIBRARY_DIRS = library_dirs
+
+    return Jetson()
+
+
+class CountedCalls:
+    """Wrap a ctypes function, counting the calls made through it."""
+
+    def __init__(self, function: Callable[..., object]) -> None:
+        self.function = function
+        self.calls = 0
+
+    def __call__(self, *args: object) -> object:
+        self.calls += 1
+        return self.function(*args)
+
+
+def send_frame(platform: epdconfig.JetsonNano, repeat: int) -> Tuple[float, int]:
+    """Get the fastest time to send a frame, and the calls into C it took."""
+    frame = bytearray(range(256)) * (FRAME_BYTES // 256) + bytearray(FRAME_BYTES % 256)
+    assert platform.SPI is not None
+    sent = ctypes.c_ulong.in_dll(platform.SPI, "bytes_sent")
+
+    if platform.spi_bulk_write is not None:
+        counted = CountedCalls(platform.spi_bulk_write)
+        # set like this since the attribute is typed as a ctypes function
+        setattr(platform, "spi_bulk_write", counted)
+        platform.spi_writebyte2(frame)
+        calls = counted.calls
+    else:
+        # without the shim, every call into C sends one byte
+        sent.value = 0
+        platform.spi_writebyte2(frame)
+        calls = sent.value
+
+    sent.value = 0
+    platform.spi_writebyte2(frame)
+    assert sent.value == len(frame), "not every byte reached the SPI library"
+
+    seconds = min(
+        timeit.repeat(lambda: platform.spi_writebyte2(frame), number=1, repeat=repeat)
+    )
+    return seconds, calls
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    jetson_module = types.ModuleType("Jetson")
+    jetson_module.GPIO = types.ModuleType("Jetson.GPIO")  # type: ignore[attr-defined]
+    sys.modules.setdefault("Jetson", jetson_module)
+    sys.modules.setdefault("Jetson.GPIO", jetson_module.GPIO)  # type: ignore
+
+    with tempfile.TemporaryDirectory() as directory:
+        with_shim = os.path.join(directory, "with_shim")
+        without_shim = os.path.join(directory, "without_shim")
+        os.mkdir(with_shim)
+        os.mkdir(without_shim)
+        build(with_shim)
+        shutil.copy(os.path.join(with_shim, "sysfs_software_spi.so"), without_shim)
+        for name, library_dir in (("per byte", without_shim), ("spi_bulk", with_shim)):
+            seconds, calls = send_frame(jetson([library_dir]), args.repeat)
+            print(
+                f"{name:9} {seconds * 1000:8.2f}ms per frame"
+                f"  {calls:7} calls into C for {FRAME_BYTES} bytes"
+            )
+
+
+if __name__ == "__main__":
+    main()
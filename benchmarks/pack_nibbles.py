@@ -0,0 +1,50 @@
+"""Time packing one 800x480 frame of palette indices into 4-bit pixels.
+
+Compares the per-pixel loop EPD.getbuffer used to run with frame.pack_nibbles:
+
+    PYTHONPATH=src python benchmarks/pack_nibbles.py
+"""
+
+import argparse
+import timeit
+from typing import Callable, List
+
+import numpy
+
+from display_connector import frame
+
+WIDTH, HEIGHT = 800, 480
+
+
+def legacy_pack(indices: bytearray) -> List[int]:
+    buf = [0x00] * (len(indices) // 2)
+    idx = 0
+    for i in range(0, len(indices), 2):
+        buf[idx] = (indices[i] << 4) + indices[i + 1]
+        idx += 1
+    return buf
+
+
+def best_of(function: Callable[[], object], repeat: int) -> float:
+    """Get the fastest of several runs, in seconds."""
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = numpy.random.default_rng(0)
+    indices = bytearray(rng.integers(0, 7, WIDTH * HEIGHT, dtype=numpy.uint8))
+    assert list(frame.pack_nibbles(indices)) == legacy_pack(indices)
+
+    legacy = best_of(lambda: legacy_pack(indices), args.repeat)
+    packed = best_of(lambda: frame.pack_nibbles(indices), args.repeat)
+    print(f"legacy loop   {legacy * 1000:8.2f}ms")
+    print(f"pack_nibbles  {packed * 1000:8.2f}ms")
+    print(f"speedup       {legacy / packed:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
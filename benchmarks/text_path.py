@@ -0,0 +1,127 @@
+"""Time the text drawn on one frame of the board, down each text path.
+
+Draws the runs a frame draws, at the sizes it draws them, with the uncached
+path pencil.draw_text used to take, with pencil.draw_text, and with the minute
+counters blitted by sprites.draw_minutes:
+
+    PYTHONPATH=src python benchmarks/text_path.py [--frames 50]
+
+The minute atlases are built into a temporary directory, so the benchmark
+leaves the real cache in ~/.cache/train-display alone. Needs pycairo.
+"""
+
+import argparse
+import tempfile
+import time
+from typing import Callable, List, Tuple
+
+import cairo
+
+from draw import colors, pencil, sprites
+
+# (text, font size) of every draw_text call on a frame, minute counters aside
+LABELS: List[Tuple[str, float]] = [
+    *[(text, 16) for text in ("LEAVE", "NOW", "SOON", "min.") for _ in range(4)],
+    *[(text, 12) for text in ("NEXT", "FLATBUSH", "NEW LOTS", "BRIGHTON")],
+    *[(text, 16) for text in ("WAKEFIELD - 241ST", "HARLEM - 148 ST", "145 ST")],
+    ("96 ST", 16),
+    *[(route, 32) for route in ("2", "3", "B", "Q")],
+]
+
+# (minutes, suffix, font size) of every minute counter on a frame
+MINUTES: List[Tuple[int | None, str, float]] = [
+    *[(minutes, "", 84) for minutes in (3, 12, None, 45)],
+    *[(minutes, " min.", 16) for minutes in (9, 15, 27, None, 4, 31, 60, 2)],
+]
+
+
+def uncached_draw_text(
+    ctx: cairo.Context, *, text: str, x: float, y: float, font_size: float
+) -> None:
+    """Draw text the way pencil.draw_text did before it cached fonts."""
+    ctx.select_font_face("Sans", cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_BOLD)
+    ctx.set_font_size(font_size)
+    ctx.set_source_rgb(*colors.NEUTRAL_900)
+    extents = ctx.text_extents(text)
+    ctx.move_to(round(x), round(y - (extents.height / 2 + extents.y_bearing) + 8))
+    ctx.show_text(text)
+
+
+def uncached_frame(ctx: cairo.Context) -> None:
+    for text, font_size in LABELS:
+        uncached_draw_text(ctx, text=text, x=20, y=20, font_size=font_size)
+    for minutes, suffix, font_size in MINUTES:
+        text = f"{minutes if minutes is not None else '--'}{suffix}"
+        uncached_draw_text(ctx, text=text, x=20, y=20, font_size=font_size)
+
+
+def draw_text(ctx: cairo.Context, text: str, font_size: float) -> None:
+    pencil.draw_text(
+        ctx,
+        text=text,
+        x=20,
+        y=20,
+        height=16,
+        font_size=font_size,
+        color=colors.NEUTRAL_900,
+    )
+
+
+def cached_frame(ctx: cairo.Context) -> None:
+    for text, font_size in LABELS:
+        draw_text(ctx, text, font_size)
+    for minutes, suffix, font_size in MINUTES:
+        draw_text(ctx, f"{minutes if minutes is not None else '--'}{suffix}", font_size)
+
+
+def sprite_frame(ctx: cairo.Context) -> None:
+    for text, font_size in LABELS:
+        draw_text(ctx, text, font_size)
+    for minutes, suffix, font_size in MINUTES:
+        sprites.draw_minutes(
+            ctx,
+            minutes=minutes,
+            suffix=suffix,
+            x=20,
+            y=20,
+            height=16,
+            font_size=font_size,
+            color=colors.NEUTRAL_900,
+        )
+
+
+def time_frames(draw_frame: Callable[[cairo.Context], None], frames: int) -> float:
+    """Get the average seconds to draw a frame's text onto a fresh surface."""
+    surface = cairo.ImageSurface(cairo.FORMAT_RGB24, 800, 480)
+    ctx = cairo.Context(surface)
+    draw_frame(ctx)
+    started = time.perf_counter()
+    for _ in range(frames):
+        draw_frame(ctx)
+    surface.flush()
+    return (time.perf_counter() - started) / frames
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--frames", type=int, default=50)
+    args = parser.parse_args()
+
+    runs = len(LABELS) + len(MINUTES)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        sprites.CACHE_DIR = cache_dir
+        sprites.get_minutes_atlas.cache_clear()
+        for name, draw_frame in (
+            ("uncached fonts", uncached_frame),
+            ("cached fonts", cached_frame),
+            ("cached + sprites", sprite_frame),
+        ):
+            seconds = time_frames(draw_frame, args.frames)
+            print(
+                f"{name:18} {seconds * 1000:7.2f}ms per frame"
+                f"  {seconds / runs * 1e6:7.1f}us per run"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,174 @@
+import hashlib
 import logging
-from display_connector import interface
+import threading
+import time
+from display_connector import epdconfig, frame, interface
+import metrics
+import numpy
 from PIL import Image
 
 
 class DisplayConnector:
-    def __init__(self):
-        self.epd = interface.EPD()
+    def __init__(
+        self,
+        min_refresh_interval=0,
+        spi_speed_hz=None,
+        spi_chunk_size=None,
+        platform=None,
+    ):
+        # None detects the board, or uses the EPD_PLATFORM environment variable
+        if platform is not None:
+            epdconfig.select_platform(platform)
+        self.epd = interface.EPD(
+            spi_speed_hz=spi_speed_hz, spi_chunk_size=spi_chunk_size
+        )
         logging.basicConfig(level=logging.DEBUG)
 
+        # seconds that must pass between two full panel refreshes
+        self.min_refresh_interval = min_refresh_interval
+        self.last_frame_digest = None
+        self.last_refresh_time = None
+        self.refreshes_performed = 0
+        self.refreshes_skipped_unchanged = 0
+        self.refreshes_skipped_throttled = 0
+
+        # single slot mailbox for the writer thread, newer frames replace
+        # older ones that were not written yet
+        self.pending_frame = None
+        self.mailbox = threading.Condition()
+        self.stopping = False
+        self.writer = None
+        self.frames_dropped = 0
+        self.busy_seconds = 0.0
+
 
     def init(self):
         logging.info("init and clear")
         self.epd.init()
         self.epd.clear()
-        
+        self.last_frame_digest = None
+
+        if self.writer is None:
+            # a writer stopped by cleanup left this set
+            self.stopping = False
+            self.writer = threading.Thread(
+                target=self.write_frames, name="display-writer", daemon=True
+            )
+            self.writer.start()
+
+
+    def submit_surface(self, surface):
+        # hand a frame to the writer thread without waiting for the panel.
+        # the surface is read when it is written, so it must not be drawn on
+        # or finished afterwards
+        self.submit(lambda: self.display_surface(surface))
+
+
+    def submit(self, write):
+        with self.mailbox:
+            if self.pending_frame is not None:
+                self.frames_dropped += 1
+                logging.info("dropping a frame that was never shown")
+            self.pending_frame = write
+            self.mailbox.notify()
+
+
+    def write_frames(self):
+        while True:
+            with self.mailbox:
+                self.mailbox.wait_for(
+                    lambda: self.pending_frame is not None or self.stopping
+                )
+                if self.stopping:
+                    return
+                write, self.pending_frame = self.pending_frame, None
+
+            started = time.monotonic()
+            try:
+                write()
+            except Exception as e:
+                logging.warning(e)
+            self.busy_seconds += time.monotonic() - started
+
+
+    def stop_writer(self):
+        # let a refresh that has started finish, frames still waiting are dropped
+        if self.writer is None:
+            return
+        with self.mailbox:
+            self.stopping = True
+            self.mailbox.notify()
+        self.writer.join()
+        self.writer = None
+
+
+    def display_surface(self, surface):
+        logging.info("displaying surface")
+        # make sure all pending drawing has reached the pixel buffer
+        surface.flush()
+        pixels = frame.rgb24_to_pixels(
+            surface.get_data(),
+            surface.get_width(),
+            surface.get_height(),
+            surface.get_stride(),
+        )
+        self.display_pixels(pixels)
+
+
+    def display_pixels(self, pixels):
+        # the packed buffer is streamed and never exists in full, so frames
+        # are compared by their source pixels and how they get dithered
+        digest = hashlib.blake2b(self.epd.dither.value.encode(), digest_size=16)
+        digest.update(numpy.ascontiguousarray(pixels))
+        return self.refresh(digest.digest(), lambda: self.epd.display_pixels(pixels))
+
+
+    def display_buffer(self, buffer):
+        digest = hashlib.blake2b(buffer, digest_size=16).digest()
+        return self.refresh(digest, lambda: self.epd.display(buffer))
+
+
+    def refresh(self, digest, write):
+        # skip the refresh when the panel already shows this exact frame
+        if digest == self.last_frame_digest:
+            self.refreshes_skipped_unchanged += 1
+            logging.info("frame unchanged, skipping refresh")
+            return False
+
+        now = time.monotonic()
+        if (
+            self.last_refresh_time is not None
+            and now - self.last_refresh_time < self.min_refresh_interval
+        ):
+            self.refreshes_skipped_throttled += 1
+            logging.info("last refresh was too recent, skipping refresh")
+            return False
+
+        with metrics.span("refresh"):
+            write()
+        self.last_frame_digest = digest
+        self.last_refresh_time = now
+        self.refreshes_performed += 1
+        logging.info("refresh stats: %s", self.refresh_stats())
+        return True
+
+
+    def refresh_stats(self):
+        return {
+            "performed": self.refreshes_performed,
+            "skipped_unchanged": self.refreshes_skipped_unchanged,
+            "skipped_throttled": self.refreshes_skipped_throttled,
+            "dropped": self.frames_dropped,
+            "busy_seconds": round(self.busy_seconds, 3),
+        }
+
 
     def display_image(self, path):
         try:
             logging.info("displaying image")
             # read bmp file 
             with Image.open(path) as image:
-                self.epd.display(self.epd.getbuffer(image))
+                self.display_buffer(self.epd.getbuffer(image))
             
         except IOError as e:
             logging.warning(e)
@@ -28,5 +176,6 @@ class DisplayConnector:
 
 
     def cleanup(self):
+        self.stop_writer()
         self.epd.sleep()
         interface.epdconfig.module_exit(cleanup=True)
\ No newline at end of file
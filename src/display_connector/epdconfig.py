@@ -27,16 +27,53 @@
 # THE SOFTWARE.
 #
 
+import ctypes
 import os
 import logging
 import sys
+import threading
 import time
-import subprocess
-
-from ctypes import *
+from collections import deque
 
 logger = logging.getLogger(__name__)
 
+# Built from spi_bulk.c. Waveshare's sysfs_software_spi.so only has a one byte
+# SYSFS_software_spi_transfer, and this sends a whole buffer through it from C.
+SPI_BULK_LIBRARY = 'spi_bulk.so'
+
+# SPI clock the panel is driven at unless configured otherwise
+DEFAULT_SPI_SPEED_HZ = 4000000
+
+# Bytes handed to the SPI driver per transfer, matching spidev's default
+# buffer size so no transfer has to be split again in the kernel module
+DEFAULT_SPI_CHUNK_SIZE = 4096
+
+# Longest single wait for a GPIO edge. The level is checked again after each
+# one, so an edge that comes just before a wait starts costs at most this long.
+EDGE_WAIT_SLICE_MS = 100
+
+
+def spi_chunks(data, chunk_size):
+    # slices of a view, so a frame that is already bytes or a bytearray is
+    # never copied to be sent
+    if not isinstance(data, (bytes, bytearray, memoryview)):
+        data = bytes(data)
+    view = memoryview(data)
+    for offset in range(0, len(view), chunk_size):
+        yield view[offset:offset + chunk_size]
+
+
+def wait_for_rising_edge(GPIO, pin, timeout):
+    # for RPi.GPIO style modules, returns False if the pin is still low at timeout
+    deadline = time.monotonic() + timeout
+    while GPIO.input(pin) == 0:
+        remaining_ms = int((deadline - time.monotonic()) * 1000)
+        if remaining_ms <= 0:
+            return False
+        GPIO.wait_for_edge(
+            pin, GPIO.RISING, timeout=min(remaining_ms, EDGE_WAIT_SLICE_MS))
+    return True
+
 
 class RaspberryPi:
     # Pin definition
@@ -53,6 +90,8 @@ class RaspberryPi:
         import gpiozero
         
         self.SPI = spidev.SpiDev()
+        self.spi_speed_hz = DEFAULT_SPI_SPEED_HZ
+        self.spi_chunk_size = DEFAULT_SPI_CHUNK_SIZE
         self.GPIO_RST_PIN    = gpiozero.LED(self.RST_PIN)
         self.GPIO_DC_PIN     = gpiozero.LED(self.DC_PIN)
         # self.GPIO_CS_PIN     = gpiozero.LED(self.CS_PIN)
@@ -95,6 +134,11 @@ class RaspberryPi:
         elif pin == self.PWR_PIN:
             return self.PWR_PIN.value
 
+    def wait_busy_idle(self, timeout):
+        # the busy pin reads 1 when idle, which gpiozero sees as pressed, and
+        # waiting on it blocks on the edge events of the pin factory
+        return bool(self.GPIO_BUSY_PIN.wait_for_press(timeout))
+
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
@@ -102,7 +146,16 @@ class RaspberryPi:
         self.SPI.writebytes(data)
 
     def spi_writebyte2(self, data):
-        self.SPI.writebytes2(data)
+        for chunk in spi_chunks(data, self.spi_chunk_size):
+            self.SPI.writebytes2(chunk)
+
+    def configure(self, speed_hz=None, chunk_size=None):
+        if speed_hz is not None:
+            self.spi_speed_hz = speed_hz
+            if self.SPI.fileno() != -1:
+                self.SPI.max_speed_hz = speed_hz
+        if chunk_size is not None:
+            self.spi_chunk_size = chunk_size
 
     def DEV_SPI_write(self, data):
         self.DEV_SPI.DEV_SPI_SendData(data)
@@ -131,7 +184,7 @@ class RaspberryPi:
                 else:
                     so_filename = os.path.join(find_dir, 'DEV_Config_32.so')
                 if os.path.exists(so_filename):
-                    self.DEV_SPI = CDLL(so_filename)
+                    self.DEV_SPI = ctypes.CDLL(so_filename)
                     break
             if self.DEV_SPI is None:
                 RuntimeError('Cannot find DEV_Config.so')
@@ -141,7 +194,7 @@ class RaspberryPi:
         else:
             # SPI device, bus = 0, device = 0
             self.SPI.open(0, 0)
-            self.SPI.max_speed_hz = 4000000
+            self.SPI.max_speed_hz = self.spi_speed_hz
             self.SPI.mode = 0b00
         return 0
 
@@ -173,15 +226,16 @@ class JetsonNano:
     BUSY_PIN = 24
     PWR_PIN  = 18
 
+    # where sysfs_software_spi.so, and spi_bulk.so if it was built, are found
+    LIBRARY_DIRS = [
+        os.path.dirname(os.path.realpath(__file__)),
+        '/usr/local/lib',
+        '/usr/lib',
+    ]
+
     def __init__(self):
-        import ctypes
-        find_dirs = [
-            os.path.dirname(os.path.realpath(__file__)),
-            '/usr/local/lib',
-            '/usr/lib',
-        ]
         self.SPI = None
-        for find_dir in find_dirs:
+        for find_dir in self.LIBRARY_DIRS:
             so_filename = os.path.join(find_dir, 'sysfs_software_spi.so')
             if os.path.exists(so_filename):
                 self.SPI = ctypes.cdll.LoadLibrary(so_filename)
@@ -189,6 +243,27 @@ class JetsonNano:
         if self.SPI is None:
             raise RuntimeError('Cannot find sysfs_software_spi.so')
 
+        # the byte read back is never used, so skip converting it. argtypes
+        # is left unset on purpose, its per call converters cost more than
+        # passing plain ints.
+        self.spi_transfer = self.SPI.SYSFS_software_spi_transfer
+        self.spi_transfer.restype = None
+        self.spi_transfer_address = ctypes.cast(self.spi_transfer, ctypes.c_void_p)
+
+        self.spi_bulk_write = None
+        for find_dir in self.LIBRARY_DIRS:
+            so_filename = os.path.join(find_dir, SPI_BULK_LIBRARY)
+            if os.path.exists(so_filename):
+                bulk = ctypes.cdll.LoadLibrary(so_filename)
+                self.spi_bulk_write = bulk.spi_bulk_write
+                self.spi_bulk_write.argtypes = [
+                    ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint32]
+                self.spi_bulk_write.restype = None
+                break
+        if self.spi_bulk_write is None:
+            logger.info("%s not found, sending one byte per call. Build it with "
+                        "python -m display_connector.spi_bulk", SPI_BULK_LIBRARY)
+
         import Jetson.GPIO
         self.GPIO = Jetson.GPIO
 
@@ -198,15 +273,30 @@ class JetsonNano:
     def digital_read(self, pin):
         return self.GPIO.input(self.BUSY_PIN)
 
+    def wait_busy_idle(self, timeout):
+        return wait_for_rising_edge(self.GPIO, self.BUSY_PIN, timeout)
+
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
     def spi_writebyte(self, data):
-        self.SPI.SYSFS_software_spi_transfer(data[0])
+        self.spi_transfer(data[0])
 
     def spi_writebyte2(self, data):
-        for i in range(len(data)):
-            self.SPI.SYSFS_software_spi_transfer(data[i])
+        if self.spi_bulk_write is not None:
+            # hand the whole buffer over in one call, without copying it if
+            # it is writable, like a bytearray or a view onto one
+            if not len(data):
+                return
+            try:
+                buffer = (ctypes.c_uint8 * len(data)).from_buffer(data)
+            except TypeError:
+                buffer = (ctypes.c_uint8 * len(data)).from_buffer_copy(bytes(data))
+            self.spi_bulk_write(self.spi_transfer_address, buffer, len(data))
+        else:
+            # still one call per byte, but the loop runs in C instead of
+            # Python bytecode
+            deque(map(self.spi_transfer, data), maxlen=0)
 
     def module_init(self):
         self.GPIO.setmode(self.GPIO.BCM)
@@ -231,7 +321,8 @@ class JetsonNano:
         self.GPIO.output(self.DC_PIN, 0)
         self.GPIO.output(self.PWR_PIN, 0)
 
-        self.GPIO.cleanup([self.RST_PIN, self.DC_PIN, self.CS_PIN, self.BUSY_PIN, self.PWR_PIN])
+        self.GPIO.cleanup(
+            [self.RST_PIN, self.DC_PIN, self.CS_PIN, self.BUSY_PIN, self.PWR_PIN])
 
 
 class SunriseX3:
@@ -249,6 +340,8 @@ class SunriseX3:
 
         self.GPIO = Hobot.GPIO
         self.SPI = spidev.SpiDev()
+        self.spi_speed_hz = DEFAULT_SPI_SPEED_HZ
+        self.spi_chunk_size = DEFAULT_SPI_CHUNK_SIZE
 
     def digital_write(self, pin, value):
         self.GPIO.output(pin, value)
@@ -256,6 +349,9 @@ class SunriseX3:
     def digital_read(self, pin):
         return self.GPIO.input(pin)
 
+    def wait_busy_idle(self, timeout):
+        return wait_for_rising_edge(self.GPIO, self.BUSY_PIN, timeout)
+
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
@@ -265,7 +361,16 @@ class SunriseX3:
     def spi_writebyte2(self, data):
         # for i in range(len(data)):
         #     self.SPI.writebytes([data[i]])
-        self.SPI.xfer3(data)
+        for chunk in spi_chunks(data, self.spi_chunk_size):
+            self.SPI.xfer3(chunk)
+
+    def configure(self, speed_hz=None, chunk_size=None):
+        if speed_hz is not None:
+            self.spi_speed_hz = speed_hz
+            if self.Flag:
+                self.SPI.max_speed_hz = speed_hz
+        if chunk_size is not None:
+            self.spi_chunk_size = chunk_size
 
     def module_init(self):
         if self.Flag == 0:
@@ -282,7 +387,7 @@ class SunriseX3:
         
             # SPI device, bus = 0, device = 0
             self.SPI.open(2, 0)
-            self.SPI.max_speed_hz = 4000000
+            self.SPI.max_speed_hz = self.spi_speed_hz
             self.SPI.mode = 0b00
             return 0
         else:
@@ -298,25 +403,86 @@ class SunriseX3:
         self.GPIO.output(self.DC_PIN, 0)
         self.GPIO.output(self.PWR_PIN, 0)
 
-        self.GPIO.cleanup([self.RST_PIN, self.DC_PIN, self.CS_PIN, self.BUSY_PIN], self.PWR_PIN)
-
-
-if sys.version_info[0] == 2:
-    process = subprocess.Popen("cat /proc/cpuinfo | grep Raspberry", shell=True, stdout=subprocess.PIPE)
-else:
-    process = subprocess.Popen("cat /proc/cpuinfo | grep Raspberry", shell=True, stdout=subprocess.PIPE, text=True)
-output, _ = process.communicate()
-if sys.version_info[0] == 2:
-    output = output.decode(sys.stdout.encoding)
-
-if "Raspberry" in output:
-    implementation = RaspberryPi()
-elif os.path.exists('/sys/bus/platform/drivers/gpio-x3'):
-    implementation = SunriseX3()
-else:
-    implementation = JetsonNano()
+        self.GPIO.cleanup(
+            [self.RST_PIN, self.DC_PIN, self.CS_PIN, self.BUSY_PIN], self.PWR_PIN)
+
+
+# Set to raspberrypi, jetson, sunrise or simulated to skip detection
+PLATFORM_ENV = 'EPD_PLATFORM'
+
+DEVICE_TREE_MODEL = '/proc/device-tree/model'
+CPUINFO = '/proc/cpuinfo'
+
+implementation = None
+selected_platform = None
+_implementation_lock = threading.Lock()
+
+
+def read_text(path):
+    try:
+        with open(path, 'rb') as file:
+            return file.read().decode(errors='replace')
+    except OSError:
+        return ''
+
+
+def detect_platform():
+    # read the board model in process instead of spawning a shell for it
+    if 'Raspberry' in read_text(DEVICE_TREE_MODEL) or 'Raspberry' in read_text(CPUINFO):
+        return 'raspberrypi'
+    if os.path.exists('/sys/bus/platform/drivers/gpio-x3'):
+        return 'sunrise'
+    return 'jetson'
+
+
+def platform_class(name):
+    if name == 'raspberrypi':
+        return RaspberryPi
+    if name == 'jetson':
+        return JetsonNano
+    if name == 'sunrise':
+        return SunriseX3
+    if name == 'simulated':
+        from display_connector.simulator import Simulated
+        return Simulated
+    raise ValueError('Unknown platform %r, expected raspberrypi, jetson, sunrise or '
+                     'simulated' % name)
+
+
+def select_platform(name):
+    # choose the platform before first use, instead of detecting it
+    global selected_platform
+    with _implementation_lock:
+        if implementation is not None and name != selected_platform:
+            raise RuntimeError('Platform %s is already in use' % selected_platform)
+        platform_class(name)
+        selected_platform = name
+
+
+def get_implementation():
+    # the platform is only detected and its GPIO opened on first use, so
+    # importing this module is cheap and works without the hardware
+    global implementation, selected_platform
+    with _implementation_lock:
+        if implementation is None:
+            if selected_platform is None:
+                selected_platform = os.environ.get(PLATFORM_ENV) or detect_platform()
+            logger.debug("using the %s platform", selected_platform)
+            implementation = platform_class(selected_platform)()
+
+            # later lookups find these directly instead of going through
+            # __getattr__
+            for func in [x for x in dir(implementation) if not x.startswith('_')]:
+                setattr(sys.modules[__name__], func, getattr(implementation, func))
+    return implementation
+
+
+def __getattr__(name):
+    # only called for names not set yet, such as pins and functions before
+    # the platform has been created
+    if name.startswith('_'):
+        raise AttributeError(name)
+    return getattr(get_implementation(), name)
 
-for func in [x for x in dir(implementation) if not x.startswith('_')]:
-    setattr(sys.modules[__name__], func, getattr(implementation, func))
 
 ### END OF FILE ###
@@ -0,0 +1,354 @@
+"""Frame buffer helpers for the 7-color panel."""
+
+import functools
+import threading
+import time
+from enum import Enum
+from queue import Full, Queue
+from typing import Iterable, Iterator, Tuple, TypeVar
+
+import numpy
+
+import metrics
+
+# Colors the panel can show, in panel index order. Index 4 is not used by the
+# panel and is kept as black so it is never picked over index 0.
+PANEL_PALETTE = numpy.array(
+    [
+        (0, 0, 0),  # black
+        (255, 255, 255),  # white
+        (255, 255, 0),  # yellow
+        (255, 0, 0),  # red
+        (0, 0, 0),  # unused
+        (0, 0, 255),  # blue
+        (0, 255, 0),  # green
+    ],
+    dtype=numpy.int16,
+)
+
+# Bits kept per channel when looking up a color in the palette tables
+LUT_BITS = 5
+LUT_SIZE = 1 << (3 * LUT_BITS)
+
+# 4x4 Bayer matrix, normalized to thresholds in (-0.5, 0.5)
+BAYER_4X4 = (
+    numpy.array(
+        [
+            [0, 8, 2, 10],
+            [12, 4, 14, 6],
+            [3, 11, 1, 9],
+            [15, 7, 13, 5],
+        ],
+        dtype=numpy.float32,
+    )
+    + 0.5
+) / 16 - 0.5
+
+# How far ordered dithering can push a channel, spanning one full black to
+# white step so grays come out with roughly their share of black pixels
+DITHER_SPREAD = 256
+
+# Rows converted and sent at a time when a frame is streamed to the panel. A
+# multiple of the Bayer matrix height, so every band starts on the same phase
+# and a streamed frame is identical to one packed whole.
+BAND_ROWS = 48
+
+# Bands packed ahead of the one being sent
+READ_AHEAD_DEPTH = 2
+
+T = TypeVar("T")
+
+
+class Dither(Enum):
+    """How to map pixels that are not one of the panel colors."""
+
+    NEAREST = "nearest"
+    ORDERED = "ordered"
+
+
+def nearest_palette_index(levels: numpy.ndarray) -> numpy.ndarray:
+    """Find the closest panel color for every combination of channel levels.
+
+    The result is indexed like the lookup tables: red in the high bits, then
+    green, then blue.
+    """
+    palette = PANEL_PALETTE.astype(numpy.int32)
+    red, green, blue = ((levels[:, None] - palette[None, :, c]) ** 2 for c in range(3))
+    distances = red[:, None, None, :] + green[None, :, None, :] + blue[None, None, :, :]
+    return distances.argmin(axis=-1).astype(numpy.uint8).reshape(-1)
+
+
+def build_palette_luts() -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """Build the nearest and ordered dither lookup tables.
+
+    Both tables are indexed by a color reduced to LUT_BITS per channel. The
+    ordered table holds one row per Bayer cell, flattened so a pixel's cell
+    offset can simply be added to its color key.
+    """
+    levels = numpy.arange(1 << LUT_BITS, dtype=numpy.int32)
+    # Use the center of each bucket as its representative level
+    centers = (levels << (8 - LUT_BITS)) + (1 << (7 - LUT_BITS))
+
+    nearest = nearest_palette_index(centers)
+
+    # Buckets holding a panel color are drawn as that color and never dithered
+    half_bucket = 1 << (7 - LUT_BITS)
+    r, g, b = numpy.meshgrid(centers, centers, centers, indexing="ij")
+    colors = numpy.stack((r, g, b), axis=-1).reshape(-1, 3)
+    exact = (abs(PANEL_PALETTE[nearest] - colors) <= half_bucket).all(axis=-1)
+
+    ordered = numpy.empty((BAYER_4X4.size, LUT_SIZE), dtype=numpy.uint8)
+    for cell, threshold in enumerate(BAYER_4X4.flat):
+        shifted = numpy.clip(centers + int(threshold * DITHER_SPREAD), 0, 255)
+        ordered[cell] = numpy.where(exact, nearest, nearest_palette_index(shifted))
+
+    return nearest, ordered.reshape(-1)
+
+
+NEAREST_LUT, ORDERED_LUT = build_palette_luts()
+
+
+@functools.lru_cache(maxsize=4)
+def bayer_offsets(width: int, height: int) -> numpy.ndarray:
+    """Offset of each pixel's Bayer cell row within ORDERED_LUT."""
+    rows = numpy.arange(height, dtype=numpy.uint32) % 4
+    columns = numpy.arange(width, dtype=numpy.uint32) % 4
+    offsets = ((rows[:, None] * 4 + columns[None, :]) * LUT_SIZE).astype(numpy.uint32)
+    offsets.flags.writeable = False
+    return offsets
+
+
+def palette_keys(
+    pixels: numpy.ndarray,
+    out: numpy.ndarray | None = None,
+    scratch: numpy.ndarray | None = None,
+) -> numpy.ndarray:
+    """Reduce 0x00RRGGBB pixel words to lookup table keys.
+
+    Args:
+        pixels: The pixel words
+        out: A uint32 array shaped like pixels to write the keys to
+        scratch: Another uint32 array shaped like pixels, used along the way
+    """
+    if out is None:
+        out = numpy.empty(pixels.shape, dtype=numpy.uint32)
+    if scratch is None:
+        scratch = numpy.empty(pixels.shape, dtype=numpy.uint32)
+
+    shift = 8 - LUT_BITS
+    mask = (1 << LUT_BITS) - 1
+    # red
+    numpy.right_shift(pixels, 16 + shift - 2 * LUT_BITS, out=out)
+    numpy.bitwise_and(out, mask << (2 * LUT_BITS), out=out)
+    # green
+    numpy.right_shift(pixels, 8 + shift - LUT_BITS, out=scratch)
+    numpy.bitwise_and(scratch, mask << LUT_BITS, out=scratch)
+    numpy.bitwise_or(out, scratch, out=out)
+    # blue
+    numpy.right_shift(pixels, shift, out=scratch)
+    numpy.bitwise_and(scratch, mask, out=scratch)
+    numpy.bitwise_or(out, scratch, out=out)
+    return out
+
+
+def quantize(
+    pixels: numpy.ndarray,
+    dither: Dither = Dither.ORDERED,
+    out: numpy.ndarray | None = None,
+    keys: numpy.ndarray | None = None,
+    scratch: numpy.ndarray | None = None,
+) -> numpy.ndarray:
+    """Convert a (height, width) array of 0x00RRGGBB words to panel indices.
+
+    Colors at or next to a panel color map straight to it. Everything else, such
+    as anti-aliased edges and the gray and orange tones in draw.colors, follows
+    the dither policy: NEAREST picks the closest panel color and ORDERED picks
+    it after applying a fixed Bayer pattern. Both are deterministic, so the same
+    frame always yields the same buffer.
+
+    The result goes to out, and keys and scratch are used along the way, when
+    given. See palette_keys.
+    """
+    keys = palette_keys(pixels, keys, scratch)
+    if dither == Dither.NEAREST:
+        # Keys are always in range, and clip mode writes out without buffering
+        return NEAREST_LUT.take(keys, out=out, mode="clip")
+
+    height, width = pixels.shape
+    keys |= bayer_offsets(width, height)
+    return ORDERED_LUT.take(keys, out=out, mode="clip")
+
+
+def rgb_to_pixels(rgb: numpy.ndarray) -> numpy.ndarray:
+    """Convert an (height, width, 3) RGB array to 0x00RRGGBB words."""
+    rgb = rgb.astype(numpy.uint32)
+    return (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+
+
+def rgb24_to_pixels(
+    data: bytes | bytearray | memoryview, width: int, height: int, stride: int
+) -> numpy.ndarray:
+    """View a cairo FORMAT_RGB24 buffer as a (height, width) array of words.
+
+    Cairo stores each pixel as a native-endian 0x00RRGGBB word, so the result
+    is a view onto the buffer and no pixel data is copied.
+    """
+    pixels = numpy.frombuffer(data, dtype=numpy.uint32).reshape(height, stride // 4)
+    return pixels[:, :width]
+
+
+def pack_nibbles(indices: bytes | bytearray | memoryview | numpy.ndarray) -> bytearray:
+    """Pack one palette index per byte into two 4-bit pixels per byte.
+
+    The first pixel of each pair goes in the high nibble, matching the order the
+    panel expects for command 0x10.
+    """
+    out = bytearray(numpy.frombuffer(indices, dtype=numpy.uint8).size // 2)
+    pack_nibbles_into(indices, out)
+    return out
+
+
+def pack_nibbles_into(
+    indices: bytes | bytearray | memoryview | numpy.ndarray,
+    out: bytearray | memoryview,
+) -> None:
+    """Pack indices like pack_nibbles, into a writable buffer half as long."""
+    pixels = numpy.frombuffer(indices, dtype=numpy.uint8)
+    packed = numpy.frombuffer(out, dtype=numpy.uint8)
+    numpy.left_shift(pixels[0::2], 4, out=packed)
+    numpy.bitwise_or(packed, pixels[1::2], out=packed)
+
+
+class BandPacker:
+    """Quantize and pack frames band by band into buffers that are reused.
+
+    Once made, packing a frame allocates no pixel-sized memory. Bands are
+    yielded as views onto a ring of buffers, so a band is overwritten a few
+    bands later: it must be sent before then and never kept. With a ring of
+    READ_AHEAD_DEPTH + 2 buffers, the band being sent, the bands waiting in
+    ReadAhead and the band being packed never share one.
+    """
+
+    def __init__(
+        self,
+        width: int,
+        band_rows: int = BAND_ROWS,
+        ring_size: int = READ_AHEAD_DEPTH + 2,
+    ) -> None:
+        if band_rows % BAYER_4X4.shape[0]:
+            raise ValueError(f"band_rows must be a multiple of {BAYER_4X4.shape[0]}")
+        self.width = width
+        self.band_rows = band_rows
+        self.keys = numpy.empty((band_rows, width), dtype=numpy.uint32)
+        self.scratch = numpy.empty((band_rows, width), dtype=numpy.uint32)
+        self.indices = numpy.empty((band_rows, width), dtype=numpy.uint8)
+        self.ring = [bytearray(band_rows * width // 2) for _ in range(ring_size)]
+
+    def pack(
+        self, pixels: numpy.ndarray, dither: Dither = Dither.ORDERED
+    ) -> Iterator[memoryview]:
+        """Yield the packed bands of a frame.
+
+        Joined together, the bands are the same bytes that quantize and
+        pack_nibbles give for the whole frame.
+        """
+        height, width = pixels.shape
+        if width != self.width:
+            raise ValueError(f"frame is {width} pixels wide, expected {self.width}")
+
+        quantize_seconds = pack_seconds = 0.0
+        for band, top in enumerate(range(0, height, self.band_rows)):
+            rows = min(self.band_rows, height - top)
+            started = time.perf_counter()
+            indices = quantize(
+                pixels[top : top + rows],
+                dither,
+                out=self.indices[:rows],
+                keys=self.keys[:rows],
+                scratch=self.scratch[:rows],
+            )
+            packed = memoryview(self.ring[band % len(self.ring)])[: rows * width // 2]
+            quantized = time.perf_counter()
+            pack_nibbles_into(indices, packed)
+            quantize_seconds += quantized - started
+            pack_seconds += time.perf_counter() - quantized
+            yield packed
+
+        # Counted per frame, leaving out the time spent waiting to hand bands on
+        metrics.record("quantize", quantize_seconds)
+        metrics.record("pack", pack_seconds)
+
+
+class ReadAhead:
+    """Produce items on a separate thread while the caller consumes them.
+
+    Up to depth items are kept ready, so the next band can be packed while the
+    current one is being sent. numpy and the SPI drivers release the GIL, so
+    the two really run at the same time. Errors raised by the producer are
+    raised again to the caller.
+
+    The thread and its queues are made on first use and kept for every frame
+    after, so streaming a frame starts no thread and makes no queue.
+    """
+
+    def __init__(self, depth: int = READ_AHEAD_DEPTH, name: str = "frame-packer"):
+        self.depth = depth
+        self.name = name
+        self.jobs: Queue = Queue(maxsize=1)
+        self.results: Queue = Queue(maxsize=depth)
+        self.stopped = threading.Event()
+        self.thread: threading.Thread | None = None
+
+    def __call__(self, items: Iterable[T]) -> Iterator[T]:
+        """Yield the items, produced ahead on the thread.
+
+        Only one caller may be reading at a time.
+        """
+        if self.thread is None:
+            self.thread = threading.Thread(
+                target=self.produce, name=self.name, daemon=True
+            )
+            self.thread.start()
+
+        self.stopped.clear()
+        self.jobs.put(items)
+        try:
+            while True:
+                item, error = self.results.get()
+                if error is not None:
+                    raise error
+                if item is None:
+                    return
+                yield item
+        finally:
+            # Once the producer is done with this job, drop anything it left
+            # behind when the caller stopped reading early
+            self.stopped.set()
+            self.jobs.join()
+            while not self.results.empty():
+                self.results.get_nowait()
+
+    def put(self, result: Tuple) -> bool:
+        # Give up once the caller stops reading, instead of blocking forever
+        while not self.stopped.is_set():
+            try:
+                self.results.put(result, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def produce(self) -> None:
+        while True:
+            items = self.jobs.get()
+            try:
+                for item in items:
+                    if not self.put((item, None)):
+                        break
+                else:
+                    self.put((None, None))
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                self.put((None, e))
+            finally:
+                del items
+                self.jobs.task_done()
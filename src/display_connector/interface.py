@@ -29,18 +29,40 @@
 #
 
 import logging
-from display_connector import epdconfig
+import time
+from display_connector import epdconfig, frame
+import metrics
 
-from PIL import Image
+import numpy
 
 # Display resolution
 EPD_WIDTH       = 800
 EPD_HEIGHT      = 480
 
+# Register settings written by init, as (command, data) pairs
+INIT_SEQUENCE = (
+    (0xAA, bytes([0x49, 0x55, 0x20, 0x08, 0x09, 0x18])),  # CMDH
+    (0x01, bytes([0x3F])),                                # PWR
+    (0x00, bytes([0x5F, 0x69])),                          # PSR
+    (0x03, bytes([0x00, 0x54, 0x00, 0x44])),              # POFS
+    (0x05, bytes([0x40, 0x1F, 0x1F, 0x2C])),              # BTST1
+    (0x06, bytes([0x6F, 0x1F, 0x17, 0x49])),              # BTST2
+    (0x08, bytes([0x6F, 0x1F, 0x1F, 0x22])),              # BTST3
+    (0x30, bytes([0x03])),                                # PLL
+    (0x50, bytes([0x3F])),                                # CDI
+    (0x60, bytes([0x02, 0x00])),                          # TCON
+    (0x61, bytes([0x03, 0x20, 0x01, 0xE0])),              # TRES, 800 x 480
+    (0x84, bytes([0x01])),                                # T_VDCS
+    (0xE3, bytes([0x2F])),                                # PWS
+)
+
+# A full 7-color refresh keeps the panel busy for about 30 seconds
+BUSY_TIMEOUT = 60
+
 logger = logging.getLogger(__name__)
 
 class EPD:
-    def __init__(self):
+    def __init__(self, spi_speed_hz=None, spi_chunk_size=None):
         self.reset_pin = epdconfig.RST_PIN
         self.dc_pin = epdconfig.DC_PIN
         self.busy_pin = epdconfig.BUSY_PIN
@@ -54,6 +76,16 @@ class EPD:
         # self.ORANGE = 0x0080ff   #   0100
         self.BLUE   = 0xff0000   #   0101
         self.GREEN  = 0x00ff00   #   0110
+        self.dither = frame.Dither.ORDERED
+        # None keeps the platform's default
+        self.spi_speed_hz = spi_speed_hz
+        self.spi_chunk_size = spi_chunk_size
+        self.last_transfer = None
+        # reused for every frame, so steady state refreshes allocate no
+        # frame sized memory
+        self.packer = frame.BandPacker(self.width)
+        self.read_ahead = frame.ReadAhead()
+        self.solid_frames = {}
         
 
     # Hardware reset
@@ -83,102 +115,98 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte2(data)
         epdconfig.digital_write(self.cs_pin, 1)
+
+    # send data that arrives in several pieces as a single transfer,
+    # returns how many bytes were sent and the seconds spent sending them,
+    # leaving out the time spent waiting for the next piece
+    def send_data_stream(self, chunks):
+        length = 0
+        seconds = 0.0
+        epdconfig.digital_write(self.dc_pin, 1)
+        epdconfig.digital_write(self.cs_pin, 0)
+        for chunk in chunks:
+            start = time.monotonic()
+            epdconfig.spi_writebyte2(chunk)
+            seconds += time.monotonic() - start
+            length += len(chunk)
+        epdconfig.digital_write(self.cs_pin, 1)
+        return length, seconds
+
+    # send a command and all of its data, with a single DC switch and a
+    # single SPI transfer for the data
+    def send_command_with_data(self, command, data):
+        self.send_command(command)
+        if data:
+            self.send_data2(data)
         
-    def ReadBusyH(self):
-        while(epdconfig.digital_read(self.busy_pin) == 0):      # 0: busy, 1: idle
+    def ReadBusyH(self, phase="busy", timeout=BUSY_TIMEOUT):
+        start = time.monotonic()
+        # block on the pin's rising edge where the platform supports it
+        wait_busy_idle = getattr(epdconfig, "wait_busy_idle", None)
+        if wait_busy_idle is not None:
+            idle = wait_busy_idle(timeout)
+        else:
+            idle = self.PollBusyH(timeout)
+        elapsed = time.monotonic() - start
+        metrics.record("busy", elapsed, phase=phase)
+
+        if idle:
+            logger.debug("%s took %.3fs", phase, elapsed)
+        else:
+            logger.warning("%s still busy after %.3fs, going on", phase, elapsed)
+        return elapsed
+
+    def PollBusyH(self, timeout):
+        deadline = time.monotonic() + timeout
+        while epdconfig.digital_read(self.busy_pin) == 0:      # 0: busy, 1: idle
+            if time.monotonic() >= deadline:
+                return False
             epdconfig.delay_ms(5)
+        return True
+
+    # report how close a frame transfer came to the configured SPI clock, to
+    # help find the fastest speed that is still stable with the wiring
+    def log_transfer(self, length, seconds):
+        metrics.record("spi_transfer", seconds)
+        speed_hz = self.spi_speed_hz or getattr(epdconfig, "DEFAULT_SPI_SPEED_HZ", None)
+        self.last_transfer = {
+            "bytes": length,
+            "seconds": round(seconds, 4),
+            "bits_per_second": int(length * 8 / seconds) if seconds > 0 else None,
+            "spi_speed_hz": speed_hz,
+        }
+        logger.info("frame transfer: %s", self.last_transfer)
 
     def TurnOnDisplay(self):
         self.send_command(0x04) # POWER_ON
-        self.ReadBusyH()
+        self.ReadBusyH("power on")
 
-        self.send_command(0x12) # DISPLAY_REFRESH
-        self.send_data(0X00)
-        self.ReadBusyH()
+        self.send_command_with_data(0x12, b"\x00") # DISPLAY_REFRESH
+        self.ReadBusyH("refresh")
         
-        self.send_command(0x02) # POWER_OFF
-        self.send_data(0X00)
-        self.ReadBusyH()
+        self.send_command_with_data(0x02, b"\x00") # POWER_OFF
+        self.ReadBusyH("power off")
         
     def init(self):
+        # software SPI platforms have no clock or chunk size to set
+        configure = getattr(epdconfig, "configure", None)
+        if configure is not None:
+            configure(self.spi_speed_hz, self.spi_chunk_size)
         if (epdconfig.module_init() != 0):
             return -1
         # EPD hardware init start
         self.reset()
-        self.ReadBusyH()
+        self.ReadBusyH("reset")
         epdconfig.delay_ms(30)
 
-        self.send_command(0xAA)   
-        self.send_data(0x49)
-        self.send_data(0x55)
-        self.send_data(0x20)
-        self.send_data(0x08)
-        self.send_data(0x09)
-        self.send_data(0x18)
-
-        self.send_command(0x01)
-        self.send_data(0x3F)
-
-        self.send_command(0x00)  
-        self.send_data(0x5F)
-        self.send_data(0x69)
-
-        self.send_command(0x03)
-        self.send_data(0x00)
-        self.send_data(0x54)
-        self.send_data(0x00)
-        self.send_data(0x44) 
-
-        self.send_command(0x05)
-        self.send_data(0x40)
-        self.send_data(0x1F)
-        self.send_data(0x1F)
-        self.send_data(0x2C)
-
-        self.send_command(0x06)
-        self.send_data(0x6F)
-        self.send_data(0x1F)
-        self.send_data(0x17)
-        self.send_data(0x49)
-
-        self.send_command(0x08)
-        self.send_data(0x6F)
-        self.send_data(0x1F)
-        self.send_data(0x1F)
-        self.send_data(0x22)
-
-        self.send_command(0x30)
-        self.send_data(0x03)
-
-        self.send_command(0x50)
-        self.send_data(0x3F)
-
-        self.send_command(0x60)
-        self.send_data(0x02)
-        self.send_data(0x00)
-
-        self.send_command(0x61)
-        self.send_data(0x03)
-        self.send_data(0x20)
-        self.send_data(0x01) 
-        self.send_data(0xE0)
-
-        self.send_command(0x84)
-        self.send_data(0x01)
-
-        self.send_command(0xE3)
-        self.send_data(0x2F)
+        for command, data in INIT_SEQUENCE:
+            self.send_command_with_data(command, data)
 
         self.send_command(0x04)
-        self.ReadBusyH()
+        self.ReadBusyH("power on")
         return 0
 
     def getbuffer(self, image):
-        # Create a pallette with the 7 colors supported by the panel
-        pal_image = Image.new("P", (1,1))
-        pal_image.putpalette( (0,0,0,  255,255,255,  255,255,0,  255,0,0,  0,0,0,  0,0,255,  0,255,0) + (0,0,0)*249)
-        # pal_image.putpalette( (0,0,0,  255,255,255,  0,255,0,   0,0,255,  255,0,0,  255,255,0, 255,128,0) + (0,0,0)*249)
-
         # Check if we need to rotate the image
         imwidth, imheight = image.size
         if(imwidth == self.width and imheight == self.height):
@@ -188,35 +216,57 @@ class EPD:
         else:
             logger.warning("Invalid image dimensions: %d x %d, expected %d x %d" % (imwidth, imheight, self.width, self.height))
 
-        # Convert the soruce image to the 7 colors, dithering if needed
-        image_7color = image_temp.convert("RGB").quantize(palette=pal_image)
-        buf_7color = bytearray(image_7color.tobytes('raw'))
+        rgb = numpy.asarray(image_temp.convert("RGB"))
+        return self.getbuffer_pixels(frame.rgb_to_pixels(rgb))
 
-        # PIL does not support 4 bit color, so pack the 4 bits of color
-        # into a single byte to transfer to the panel
-        buf = [0x00] * int(self.width * self.height / 2)
-        idx = 0
-        for i in range(0, len(buf_7color), 2):
-            buf[idx] = (buf_7color[i] << 4) + buf_7color[i+1]
-            idx += 1
-            
-        return buf
+    def getbuffer_pixels(self, pixels):
+        # Convert the source pixels to the 7 colors with a precomputed
+        # lookup table, dithering anything that is not a panel color
+        indices = frame.quantize(pixels, self.dither)
+
+        # The panel takes 4 bits per pixel, so pack two pixels into each
+        # byte to transfer to the panel
+        return frame.pack_nibbles(indices)
 
     def display(self, image):
         self.send_command(0x10)
+        start = time.monotonic()
         self.send_data2(image)
+        self.log_transfer(len(image), time.monotonic() - start)
 
         self.TurnOnDisplay()
         
+    # quantize, pack and send a frame band by band, packing the next band
+    # while the current one is on the bus
+    def display_pixels(self, pixels):
+        height, width = pixels.shape
+        if(width != self.width or height != self.height):
+            logger.warning("Invalid image dimensions: %d x %d, expected %d x %d" % (width, height, self.width, self.height))
+
+        if(width != self.packer.width):
+            self.packer = frame.BandPacker(width)
+
+        self.send_command(0x10)
+        bands = self.read_ahead(self.packer.pack(pixels, self.dither))
+        length, seconds = self.send_data_stream(bands)
+        self.log_transfer(length, seconds)
+
+        self.TurnOnDisplay()
+
+    # a whole frame of one color, built once per color
+    def solid_frame(self, color):
+        if color not in self.solid_frames:
+            self.solid_frames[color] = bytes([color]) * (self.height * self.width // 2)
+        return self.solid_frames[color]
+
     def clear(self, color=0x11):
         self.send_command(0x10)
-        self.send_data2([color] * int(self.height) * int(self.width/2))
+        self.send_data2(self.solid_frame(color))
 
         self.TurnOnDisplay()
 
     def sleep(self):
-        self.send_command(0x07) # DEEP_SLEEP
-        self.send_data(0XA5)
+        self.send_command_with_data(0x07, b"\xa5") # DEEP_SLEEP
         
         epdconfig.delay_ms(2000)
         epdconfig.module_exit()
@@ -0,0 +1,274 @@
+"""Stand-in for the panel hardware, for running without a display attached.
+
+The simulated platform takes the same calls as the real boards in epdconfig
+and keeps a virtual clock that advances as the panel would: SPI transfers take
+as long as the configured bus speed allows, and BUSY stays low for as long as
+the panel takes to power on, refresh and power off. Nothing ever sleeps, so a
+full refresh is simulated in milliseconds.
+
+Run this module to measure a full init, display and sleep cycle:
+
+    python -m display_connector.simulator [--png PATH] [--json]
+"""
+
+import argparse
+import json
+import logging
+import time
+from typing import Dict, Iterable, List, Tuple
+
+import numpy
+
+from display_connector import frame
+
+logger = logging.getLogger(__name__)
+
+# Seconds BUSY stays low after each command, roughly as measured on a 7.3"
+# 7-color panel
+BUSY_SECONDS = {
+    0x04: 0.1,  # POWER_ON
+    0x12: 30.0,  # DISPLAY_REFRESH
+    0x02: 0.05,  # POWER_OFF
+}
+
+# Seconds BUSY stays low after a hardware reset
+RESET_BUSY_SECONDS = 0.02
+
+# Fixed cost of each GPIO write and each SPI transfer, on top of the bits sent
+PIN_WRITE_SECONDS = 5e-6
+SPI_CALL_SECONDS = 20e-6
+
+SPI_SPEED_HZ = 4000000
+
+# Panel resolution set by command 0x61, used until the driver sends one
+DEFAULT_RESOLUTION = (800, 480)
+
+# (virtual time, event, details)
+TranscriptEntry = Tuple[float, str, Tuple]
+
+
+def decode_frame(data: bytes | bytearray, width: int, height: int) -> numpy.ndarray:
+    """Turn a 4bpp frame sent with command 0x10 back into an RGB image."""
+    packed = numpy.frombuffer(data, dtype=numpy.uint8, count=width * height // 2)
+    indices = numpy.empty(packed.size * 2, dtype=numpy.uint8)
+    indices[0::2] = packed >> 4
+    indices[1::2] = packed & 0x0F
+    # Indices past the palette show as black, like the unused index 4
+    indices[indices >= len(frame.PANEL_PALETTE)] = 0
+    return frame.PANEL_PALETTE[indices].astype(numpy.uint8).reshape(height, width, 3)
+
+
+# pylint: disable=too-many-instance-attributes
+class Simulated:
+    """Platform backend that models the panel's timing on a virtual clock.
+
+    Selected with EPD_PLATFORM=simulated, or epdconfig.select_platform.
+
+    Only the last refreshed frame is kept. The transcript of every pin write
+    and SPI transfer is off unless asked for, since it holds a copy of every
+    frame sent and would grow without bound on a display left running.
+    """
+
+    # Pin definition, the same as on the real boards
+    RST_PIN = 17
+    DC_PIN = 25
+    CS_PIN = 8
+    BUSY_PIN = 24
+    PWR_PIN = 18
+
+    def __init__(self, record_transcript: bool = False) -> None:
+        self.clock = 0.0
+        self.busy_until = 0.0
+        self.spi_speed_hz = SPI_SPEED_HZ
+        self.pins: Dict[int, int] = {}
+
+        self.record_transcript = record_transcript
+        self.transcript: List[TranscriptEntry] = []
+
+        # the command being sent data, and what each command was sent last
+        self.command: int | None = None
+        self.registers: Dict[int, bytearray] = {}
+        self.last_frame: numpy.ndarray | None = None
+        self.refreshes = 0
+
+        self.commands = 0
+        self.bytes_sent = 0
+        self.spi_calls = 0
+        self.pin_writes = 0
+        self.busy_seconds = 0.0
+
+    def log(self, event: str, *details: object) -> None:
+        if self.record_transcript:
+            self.transcript.append((self.clock, event, details))
+
+    def digital_write(self, pin: int, value: int) -> None:
+        self.clock += PIN_WRITE_SECONDS
+        self.pin_writes += 1
+        self.log("pin", pin, value)
+        # the panel is busy for a moment after coming out of reset
+        if pin == self.RST_PIN and value and not self.pins.get(pin, 0):
+            self.busy_until = self.clock + RESET_BUSY_SECONDS
+        self.pins[pin] = value
+
+    def digital_read(self, pin: int) -> int:
+        # the busy pin reads 1 when the panel is idle
+        if pin == self.BUSY_PIN:
+            return int(self.clock >= self.busy_until)
+        return self.pins.get(pin, 0)
+
+    def wait_busy_idle(self, timeout: float) -> bool:
+        waited = min(max(0.0, self.busy_until - self.clock), timeout)
+        self.clock += waited
+        self.busy_seconds += waited
+        self.log("busy", waited)
+        return self.clock >= self.busy_until
+
+    def delay_ms(self, delaytime: float) -> None:
+        self.clock += delaytime / 1000.0
+        self.log("delay", delaytime)
+
+    def spi_writebyte(self, data: Iterable[int]) -> None:
+        self.transfer(bytes(data))
+
+    def spi_writebyte2(self, data: Iterable[int]) -> None:
+        self.transfer(bytes(data))
+
+    def configure(
+        self, speed_hz: int | None = None, chunk_size: int | None = None
+    ) -> None:
+        if speed_hz is not None:
+            self.spi_speed_hz = speed_hz
+
+    def transfer(self, data: bytes) -> None:
+        self.clock += SPI_CALL_SECONDS + len(data) * 8 / self.spi_speed_hz
+        self.spi_calls += 1
+        self.bytes_sent += len(data)
+        self.log("spi", self.pins.get(self.DC_PIN, 0), data)
+
+        if not self.pins.get(self.DC_PIN, 0):
+            for command in data:
+                self.run_command(command)
+        elif self.command is not None:
+            self.registers[self.command] += data
+            if self.command in (0x12, 0x02):
+                self.start_busy(self.command)
+
+    def run_command(self, command: int) -> None:
+        self.commands += 1
+        self.command = command
+        self.registers[command] = bytearray()
+        if command == 0x04:
+            self.start_busy(command)
+        elif command == 0x12:
+            self.refreshes += 1
+            self.last_frame = self.decode_frame()
+
+    def start_busy(self, command: int) -> None:
+        self.busy_until = self.clock + BUSY_SECONDS.get(command, 0.0)
+
+    def resolution(self) -> Tuple[int, int]:
+        """Get the resolution set with command 0x61, as (width, height)."""
+        data = self.registers.get(0x61)
+        if not data or len(data) < 4:
+            return DEFAULT_RESOLUTION
+        return (data[0] << 8 | data[1], data[2] << 8 | data[3])
+
+    def decode_frame(self) -> numpy.ndarray:
+        """Decode the frame last sent with command 0x10."""
+        width, height = self.resolution()
+        data = bytes(self.registers.get(0x10, b""))
+        data = data.ljust(width * height // 2, b"\x00")
+        return decode_frame(data, width, height)
+
+    def module_init(self, cleanup: bool = False) -> int:
+        self.log("init")
+        return 0
+
+    def module_exit(self, cleanup: bool = False) -> None:
+        self.log("exit")
+
+    def stats(self) -> Dict[str, float]:
+        """Summarize what has been sent and how long it took on the panel."""
+        return {
+            "clock": round(self.clock, 6),
+            "busy_seconds": round(self.busy_seconds, 6),
+            "commands": self.commands,
+            "bytes_sent": self.bytes_sent,
+            "spi_calls": self.spi_calls,
+            "pin_writes": self.pin_writes,
+            "refreshes": self.refreshes,
+        }
+
+
+def measure(pixels: numpy.ndarray, spi_speed_hz: int | None = None) -> Dict:
+    """Run init, display and sleep on the simulated platform and time them.
+
+    Each phase reports the panel time from the virtual clock and the CPU time
+    the driver actually spent, which is what regresses when the driver does.
+    """
+    # pylint: disable=import-outside-toplevel
+    from display_connector import epdconfig, interface
+
+    epdconfig.select_platform("simulated")
+    simulator = epdconfig.get_implementation()
+    simulator.record_transcript = True
+    epd = interface.EPD(spi_speed_hz=spi_speed_hz)
+
+    phases = {}
+    for name, run in (
+        ("init", epd.init),
+        ("display", lambda: epd.display_pixels(pixels)),
+        ("sleep", epd.sleep),
+    ):
+        clock, started = simulator.clock, time.perf_counter()
+        run()
+        phases[name] = {
+            "panel_seconds": round(simulator.clock - clock, 6),
+            "cpu_seconds": round(time.perf_counter() - started, 6),
+        }
+    return {"phases": phases, "stats": simulator.stats()}
+
+
+def test_pattern(width: int, height: int) -> numpy.ndarray:
+    """Vertical bars of every panel color over a gray gradient."""
+    colors = [0x000000, 0xFFFFFF, 0xFFFF00, 0xFF0000, 0x0000FF, 0x00FF00]
+    columns = numpy.arange(width) * len(colors) // width
+    pixels = numpy.array(colors, dtype=numpy.uint32)[columns][None, :].repeat(height, 0)
+    levels = (numpy.arange(width, dtype=numpy.uint32) * 255 // (width - 1))[None, :]
+    pixels[height // 2 :] = (levels << 16 | levels << 8 | levels).repeat(
+        height - height // 2, 0
+    )
+    return pixels
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=measure.__doc__)
+    parser.add_argument("--png", metavar="PATH", help="save the decoded frame")
+    parser.add_argument("--json", action="store_true", help="print JSON only")
+    parser.add_argument("--spi-speed", type=int, default=None, metavar="HZ")
+    args = parser.parse_args()
+
+    width, height = DEFAULT_RESOLUTION
+    result = measure(test_pattern(width, height), args.spi_speed)
+
+    if args.png:
+        # pylint: disable=import-outside-toplevel
+        from PIL import Image
+
+        from display_connector import epdconfig
+
+        Image.fromarray(epdconfig.get_implementation().last_frame).save(args.png)
+
+    if args.json:
+        print(json.dumps(result))
+        return
+    for name, phase in result["phases"].items():
+        print(
+            f"{name:8} panel {phase['panel_seconds']:9.3f}s"
+            f"  cpu {phase['cpu_seconds'] * 1000:8.1f}ms"
+        )
+    print(result["stats"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+/*
+ * Bulk writes for the Jetson Nano's software SPI.
+ *
+ * Waveshare's sysfs_software_spi.so only exports SYSFS_software_spi_transfer,
+ * which clocks out a single byte. Sending a frame through it from Python takes
+ * one ctypes call per byte, 192,000 for a full frame. spi_bulk_write is given
+ * that transfer function and a whole buffer, and makes the per byte calls from
+ * C, so a frame costs one ctypes call.
+ *
+ * epdconfig.JetsonNano uses it when spi_bulk.so is next to
+ * sysfs_software_spi.so. Build it there on the Jetson with:
+ *
+ *     python -m display_connector.spi_bulk
+ */
+
+#include <stdint.h>
+
+typedef uint8_t (*spi_transfer_fn)(uint8_t data);
+
+void spi_bulk_write(spi_transfer_fn transfer, const uint8_t *data, uint32_t length)
+{
+    for (uint32_t i = 0; i < length; i++) {
+        transfer(data[i]);
+    }
+}
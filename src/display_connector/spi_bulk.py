@@ -0,0 +1,60 @@
+"""Build spi_bulk.so, the Jetson Nano's bulk SPI writes, from spi_bulk.c.
+
+The library goes next to sysfs_software_spi.so, where epdconfig.JetsonNano
+looks for it. Run this on the Jetson, as a user who can write there:
+
+    python -m display_connector.spi_bulk [--output-dir DIR] [--cc gcc]
+
+Without it, frames are still sent, with one ctypes call per byte.
+"""
+
+import argparse
+import os
+import subprocess
+
+from display_connector import epdconfig
+
+SOURCE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "spi_bulk.c")
+
+SPI_LIBRARY = "sysfs_software_spi.so"
+
+
+def spi_library_dir() -> str | None:
+    """Find the directory JetsonNano loads sysfs_software_spi.so from."""
+    for find_dir in epdconfig.JetsonNano.LIBRARY_DIRS:
+        if os.path.exists(os.path.join(find_dir, SPI_LIBRARY)):
+            return find_dir
+    return None
+
+
+def build(output_dir: str, cc: str = "gcc") -> str:
+    """Compile spi_bulk.c into a directory.
+
+    Returns:
+        The path of the library built
+    """
+    path = os.path.join(output_dir, epdconfig.SPI_BULK_LIBRARY)
+    subprocess.run([cc, "-O2", "-shared", "-fPIC", "-o", path, SOURCE], check=True)
+    return path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--output-dir",
+        help=f"where to put the library, defaults to next to {SPI_LIBRARY}",
+    )
+    parser.add_argument("--cc", default="gcc", help="C compiler to use")
+    args = parser.parse_args()
+
+    output_dir = args.output_dir or spi_library_dir()
+    if output_dir is None:
+        parser.error(
+            f"{SPI_LIBRARY} not found in {', '.join(epdconfig.JetsonNano.LIBRARY_DIRS)}"
+            ", install it first or pass --output-dir"
+        )
+    print(build(output_dir, args.cc))
+
+
+if __name__ == "__main__":
+    main()
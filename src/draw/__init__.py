@@ -1,15 +1,16 @@
 """Draw subway time image."""
 
+import functools
 import os
 from datetime import datetime
 from enum import Enum
-from typing import Dict, List, Tuple, TypedDict
+from typing import Dict, List, NamedTuple, Tuple, TypedDict
 
 # pylint: disable=no-member
 # missing types because of C bindings
 import cairo
 
-from draw import colors, pencil
+from draw import colors, pencil, sprites
 
 WIDTH: int = 800
 HEIGHT: int = 480
@@ -60,25 +61,27 @@ def draw_station_status(ctx: cairo.Context, *, x: int, y: int, status: Status) -
     )
 
 
-def draw_leave_instructions(
-    ctx: cairo.Context, *, x: int, y: int, leave: LeaveInstructions
-) -> None:
-    """Draw the leave instructions for a station."""
-
-    box_y = y + 168
-    indicator_y = y + 176
-    text_y = y + 184
-
+def draw_leave_instructions_box(ctx: cairo.Context, *, x: int, y: int) -> None:
+    """Draw the box behind the leave instructions for a station."""
     pencil.draw_rounded_rectangle(
         ctx,
         x=x + 92,
-        y=box_y,
+        y=y + 168,
         width=284,
         height=48,
         radius=8,
         fill=colors.NEUTRAL_200,
     )
 
+
+def draw_leave_instructions(
+    ctx: cairo.Context, *, x: int, y: int, leave: LeaveInstructions
+) -> None:
+    """Draw the leave instructions for a station, on top of their box."""
+
+    indicator_y = y + 176
+    text_y = y + 184
+
     leave_text_color = (
         colors.NEUTRAL_300
         if leave == LeaveInstructions.NO_INSTRUCTIONS
@@ -181,9 +184,9 @@ def find_next_train_times(times: List[int], min_minutes: int) -> List[int] | Non
             return next_times
     return None
 
-def draw_upcoming_train_time(ctx: cairo.Context, *, x: int, y: int, time: int | None) -> None:
-    """Draw the main train time display."""
-   
+
+def draw_upcoming_train_time_box(ctx: cairo.Context, *, x: int, y: int) -> None:
+    """Draw the box and unit label of the main train time display."""
     pencil.draw_rounded_rectangle(
         ctx,
         x=x + 92,
@@ -193,17 +196,6 @@ def draw_upcoming_train_time(ctx: cairo.Context, *, x: int, y: int, time: int |
         radius=8,
         fill=colors.NEUTRAL_000,
     )
-    
-    minutes_until = time if time is not None else "--"
-    pencil.draw_text(
-        ctx,
-        text=str(minutes_until),
-        x=x + 104,
-        y=y + 64,
-        height=68,
-        font_size=84,
-        color=colors.NEUTRAL_900,
-    )
     pencil.draw_text(
         ctx,
         text="min.",
@@ -214,7 +206,24 @@ def draw_upcoming_train_time(ctx: cairo.Context, *, x: int, y: int, time: int |
         color=colors.NEUTRAL_900,
     )
 
-def draw_train_time_details(ctx: cairo.Context, *, x: int, y: int, time: int | None, label: str) -> None:
+
+def draw_upcoming_train_time(
+    ctx: cairo.Context, *, x: int, y: int, time: int | None
+) -> None:
+    """Draw the main train time display, on top of its box."""
+    sprites.draw_minutes(
+        ctx,
+        minutes=time,
+        x=x + 104,
+        y=y + 64,
+        height=68,
+        font_size=84,
+        color=colors.NEUTRAL_900,
+    )
+
+
+def draw_train_time_label(ctx: cairo.Context, *, x: int, y: int, label: str) -> None:
+    """Draw the label above a secondary train time."""
     pencil.draw_text(
         ctx,
         text=label,
@@ -224,35 +233,103 @@ def draw_train_time_details(ctx: cairo.Context, *, x: int, y: int, time: int | N
         font_size=12,
         color=colors.NEUTRAL_900,
     )
-    minutes_until_next = time if time is not None else "--"
-    pencil.draw_text(
+
+
+def draw_train_time_details(
+    ctx: cairo.Context, *, x: int, y: int, time: int | None
+) -> None:
+    """Draw a secondary train time below its label."""
+    sprites.draw_minutes(
         ctx,
-        text=str(minutes_until_next) + " min.",
+        minutes=time,
+        suffix=" min.",
         x=x,
         y=y + 18,
         height=16,
         font_size=16,
         color=colors.NEUTRAL_900,
     )
- 
-# pylint: disable=too-many-arguments
-def draw_station(
-    ctx: cairo.Context,
-    *,
-    x: int,
-    y: int,
-    station: str,
-    reverseDir: str,
-    line: Line,
-    status: Status,
-    times: Dict[str, List[int]],
-    walk_time: int,
-) -> None:
-    """Draw all details for a station."""
-    train_times = find_next_train_times(times["N"], walk_time)
-    reverse_train_times = find_next_train_times(times["S"], walk_time)
 
-    pencil.draw_rounded_rectangle(ctx, x=x + 20, y=y + 28, width=48, height=116, radius=100, fill=colors.NEUTRAL_200)
+
+class Station(NamedTuple):
+    """Layout and configuration of a station on the board."""
+
+    x: int
+    y: int
+    name: str
+    reverse_dir: str
+    route: str
+    line_color: Tuple[float, float, float]
+    line_background: Tuple[float, float, float]
+    walk_time: int
+
+    @property
+    def line(self) -> Line:
+        """The subway line serving the station."""
+        return {
+            "name": self.route,
+            "color": self.line_color,
+            "background": self.line_background,
+        }
+
+
+STATIONS: Tuple[Station, ...] = (
+    Station(
+        x=0,
+        y=0,
+        name="WAKEFIELD - 241ST",
+        reverse_dir="FLATBUSH",
+        route="2",
+        line_color=colors.NEUTRAL_000,
+        line_background=colors.SUBWAY_RED,
+        walk_time=10,
+    ),
+    Station(
+        x=0,
+        y=HEIGHT // 2,
+        name="HARLEM - 148 ST",
+        reverse_dir="NEW LOTS",
+        route="3",
+        line_color=colors.NEUTRAL_000,
+        line_background=colors.SUBWAY_RED,
+        walk_time=10,
+    ),
+    Station(
+        x=WIDTH // 2,
+        y=0,
+        name="145 ST",
+        reverse_dir="BRIGHTON",
+        route="B",
+        line_color=colors.NEUTRAL_000,
+        line_background=colors.SUBWAY_ORANGE,
+        walk_time=8,
+    ),
+    Station(
+        x=WIDTH // 2,
+        y=HEIGHT // 2,
+        name="96 ST",
+        reverse_dir="CONEY ISL",
+        route="Q",
+        line_color=colors.NEUTRAL_900,
+        line_background=colors.SUBWAY_YELLOW,
+        walk_time=8,
+    ),
+)
+
+
+def draw_station_background(
+    ctx: cairo.Context, *, x: int, y: int, station: str, reverseDir: str, line: Line
+) -> None:
+    """Draw the parts of a station that do not change between frames."""
+    pencil.draw_rounded_rectangle(
+        ctx,
+        x=x + 20,
+        y=y + 28,
+        width=48,
+        height=116,
+        radius=100,
+        fill=colors.NEUTRAL_200,
+    )
     pencil.draw_circle(ctx, x=x + 20, y=y + 28, radius=24, fill=line["background"])
     pencil.draw_text(
         ctx,
@@ -266,14 +343,7 @@ def draw_station(
         center=True,
     )
 
-    if train_times is not None and train_times[0] < walk_time + 2:
-        draw_leave_instructions(ctx, x=x, y=y, leave=LeaveInstructions.NOW)
-    elif train_times is not None and train_times[0] < walk_time + 5:
-        draw_leave_instructions(ctx, x=x, y=y, leave=LeaveInstructions.SOON)
-    else:
-        draw_leave_instructions(ctx, x=x, y=y, leave=LeaveInstructions.NO_INSTRUCTIONS)
-    
-    draw_station_status(ctx, x=x, y=y, status=status)
+    draw_leave_instructions_box(ctx, x=x, y=y)
 
     # Draw station name
     pencil.draw_text(
@@ -286,108 +356,156 @@ def draw_station(
         color=colors.NEUTRAL_900,
     )
 
+    draw_upcoming_train_time_box(ctx, x=x, y=y)
+    draw_train_time_label(ctx, x=x + 300, y=y + 54, label="NEXT")
+    draw_train_time_label(ctx, x=x + 300, y=y + 108, label=reverseDir)
+
+
+def draw_station_times(
+    ctx: cairo.Context,
+    *,
+    x: int,
+    y: int,
+    status: Status,
+    times: Dict[str, List[int]],
+    walk_time: int,
+) -> None:
+    """Draw the parts of a station that change with the train times and status."""
+    train_times = find_next_train_times(times["N"], walk_time)
+    reverse_train_times = find_next_train_times(times["S"], walk_time)
+
+    if train_times is not None and train_times[0] < walk_time + 2:
+        draw_leave_instructions(ctx, x=x, y=y, leave=LeaveInstructions.NOW)
+    elif train_times is not None and train_times[0] < walk_time + 5:
+        draw_leave_instructions(ctx, x=x, y=y, leave=LeaveInstructions.SOON)
+    else:
+        draw_leave_instructions(ctx, x=x, y=y, leave=LeaveInstructions.NO_INSTRUCTIONS)
+
+    draw_station_status(ctx, x=x, y=y, status=status)
+
     # Draw upcoming train time
-    draw_upcoming_train_time(ctx, x=x, y=y, time=train_times[0] if train_times is not None else None)
+    draw_upcoming_train_time(
+        ctx, x=x, y=y, time=train_times[0] if train_times is not None else None
+    )
 
     # Draw next train time details
-    draw_train_time_details(ctx, x=x + 300, y=y + 54, time=train_times[1] if train_times is not None else None, label="NEXT")
+    draw_train_time_details(
+        ctx,
+        x=x + 300,
+        y=y + 54,
+        time=train_times[1] if train_times is not None else None,
+    )
 
     # Draw reverse train time details
-    draw_train_time_details(ctx, x=x + 300, y=y + 108, time=reverse_train_times[0] if reverse_train_times is not None else None, label=reverseDir)
+    draw_train_time_details(
+        ctx,
+        x=x + 300,
+        y=y + 108,
+        time=reverse_train_times[0] if reverse_train_times is not None else None,
+    )
 
 
-def generate_subway_time_image(
-    times: Dict[str, Dict[str, List[int]]], alerts: Dict
+# pylint: disable=too-many-arguments
+def draw_station(
+    ctx: cairo.Context,
+    *,
+    x: int,
+    y: int,
+    station: str,
+    reverseDir: str,
+    line: Line,
+    status: Status,
+    times: Dict[str, List[int]],
+    walk_time: int,
+) -> None:
+    """Draw all details for a station."""
+    draw_station_background(
+        ctx, x=x, y=y, station=station, reverseDir=reverseDir, line=line
+    )
+    draw_station_times(ctx, x=x, y=y, status=status, times=times, walk_time=walk_time)
+
+
+@functools.lru_cache(maxsize=2)
+def render_background(
+    stations: Tuple[Station, ...], width: int, height: int
 ) -> cairo.ImageSurface:
-    """Generate a subway time image."""
-    surface = cairo.ImageSurface(cairo.FORMAT_RGB24, WIDTH, HEIGHT)
+    """Render everything on the board that does not change between frames.
+
+    The result is cached per layout, so a different set of stations or board
+    size renders a new background. It must not be drawn on.
+    """
+    surface = cairo.ImageSurface(cairo.FORMAT_RGB24, width, height)
     ctx = cairo.Context(surface)
 
     ctx.set_source_rgb(*colors.NEUTRAL_100)
-    ctx.rectangle(0, 0, WIDTH, HEIGHT)
+    ctx.rectangle(0, 0, width, height)
     ctx.fill()
 
-    draw_station(
-        ctx,
-        x=0,
-        y=0,
-        station="WAKEFIELD - 241ST",
-        reverseDir="FLATBUSH",
-        line={
-            "name": "2",
-            "color": colors.NEUTRAL_000,
-            "background": colors.SUBWAY_RED,
-        },
-        status=Status.OK if alerts["2"] is None else Status.DELAYED,
-        times={
-            "N": times["N"]["2"],
-            "S": times["S"]["2"],
-        },
-        walk_time=10,
-    )
-    draw_station(
-        ctx,
-        x=0,
-        y=HEIGHT // 2,
-        station="HARLEM - 148 ST",
-        reverseDir="NEW LOTS",
-        line={
-            "name": "3",
-            "color": colors.NEUTRAL_000,
-            "background": colors.SUBWAY_RED,
-        },
-        status=Status.OK if alerts["3"] is None else Status.DELAYED,
-        times={
-            "N": times["N"]["3"],
-            "S": times["S"]["3"],
-        },
-        walk_time=10,
-    )
-    draw_station(
-        ctx,
-        x=WIDTH // 2,
-        y=0,
-        station="145 ST",
-        reverseDir="BRIGHTON",
-        line={
-            "name": "B",
-            "color": colors.NEUTRAL_000,
-            "background": colors.SUBWAY_ORANGE,
-        },
-        status=Status.OK if alerts["B"] is None else Status.DELAYED,
-        times={
-            "N": times["N"]["B"],
-            "S": times["S"]["B"],
-        },
-        walk_time=8,
-    )
-    draw_station(
-        ctx,
-        x=WIDTH // 2,
-        y=HEIGHT // 2,
-        station="96 ST",
-        reverseDir="CONEY ISL",
-        line={
-            "name": "Q",
-            "color": colors.NEUTRAL_900,
-            "background": colors.SUBWAY_YELLOW,
-        },
-        status=Status.OK if alerts["Q"] is None else Status.DELAYED,
-        times={
-            "N": times["N"]["Q"],
-            "S": times["S"]["Q"],
-        },
-        walk_time=8,
-    )
+    for station in stations:
+        draw_station_background(
+            ctx,
+            x=station.x,
+            y=station.y,
+            station=station.name,
+            reverseDir=station.reverse_dir,
+            line=station.line,
+        )
 
     pencil.draw_line(ctx, x1=20, y1=240, x2=376, y2=240, stroke=colors.NEUTRAL_200)
     pencil.draw_line(ctx, x1=424, y1=240, x2=750, y2=240, stroke=colors.NEUTRAL_200)
     pencil.draw_line(ctx, x1=400, y1=28, x2=400, y2=216, stroke=colors.NEUTRAL_200)
     pencil.draw_line(ctx, x1=400, y1=264, x2=400, y2=456, stroke=colors.NEUTRAL_200)
 
+    surface.flush()
     return surface
 
 
+def generate_subway_time_image(
+    times: Dict[str, Dict[str, List[int]]],
+    alerts: Dict,
+    stations: Tuple[Station, ...] = STATIONS,
+) -> cairo.ImageSurface:
+    """Generate a subway time image."""
+    surface = cairo.ImageSurface(cairo.FORMAT_RGB24, WIDTH, HEIGHT)
+    ctx = cairo.Context(surface)
+
+    # Start from a copy of the cached background
+    ctx.set_source_surface(render_background(stations, WIDTH, HEIGHT), 0, 0)
+    ctx.set_operator(cairo.OPERATOR_SOURCE)
+    ctx.paint()
+    ctx.set_operator(cairo.OPERATOR_OVER)
+
+    for station in stations:
+        draw_station_times(
+            ctx,
+            x=station.x,
+            y=station.y,
+            status=Status.OK if alerts[station.route] is None else Status.DELAYED,
+            times={
+                "N": times["N"][station.route],
+                "S": times["S"][station.route],
+            },
+            walk_time=station.walk_time,
+        )
+
+    return surface
+
+
+def save_subway_time_image(surface: cairo.ImageSurface, output_path: str) -> None:
+    """Save a rendered subway time image to the specified path.
+
+    Args:
+        surface: The rendered image
+        output_path: The path where the image will be saved
+    """
+    # Create output directory if it doesn't exist, a bare file name has none
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    surface.write_to_png(output_path)
+
+
 def create_subway_time_image(
     output_path: str, times: Dict[str, Dict[str, List[int]]], alerts: Dict
 ) -> None:
@@ -396,9 +514,6 @@ def create_subway_time_image(
     Args:
         output_path: The path where the image will be saved
     """
-    # Create output directory if it doesn't exist
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-
     surface = generate_subway_time_image(times, alerts)
-    surface.write_to_png(output_path)
+    save_subway_time_image(surface, output_path)
     surface.finish()
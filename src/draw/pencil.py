@@ -1,5 +1,6 @@
 """Drawing utils."""
 
+import functools
 import math
 from typing import Tuple
 
@@ -7,6 +8,8 @@ from typing import Tuple
 # missing types because of C bindings
 import cairo
 
+FONT_FAMILY = "Sans"
+
 
 def draw_stroke_or_fill(
     ctx: cairo.Context,
@@ -94,6 +97,27 @@ def draw_rounded_rectangle(
     draw_stroke_or_fill(ctx, fill=fill, stroke=stroke)
 
 
+@functools.lru_cache(maxsize=32)
+def get_scaled_font(font_size: float, weight: cairo.FontWeight) -> cairo.ScaledFont:
+    """Get the font for a size and weight, resolving it only once per process.
+
+    The font is taken from a context on an image surface, so it carries the
+    same font options as the fonts cairo would pick when drawing the board.
+    """
+    ctx = cairo.Context(cairo.ImageSurface(cairo.FORMAT_RGB24, 1, 1))
+    ctx.select_font_face(FONT_FAMILY, cairo.FONT_SLANT_NORMAL, weight)
+    ctx.set_font_size(font_size)
+    return ctx.get_scaled_font()
+
+
+@functools.lru_cache(maxsize=512)
+def get_text_extents(
+    text: str, font_size: float, weight: cairo.FontWeight
+) -> cairo.TextExtents:
+    """Measure text, reusing earlier measurements of the same run."""
+    return get_scaled_font(font_size, weight).text_extents(text)
+
+
 # todo: make a position class
 # pylint: disable=too-many-arguments
 def draw_text(
@@ -107,13 +131,13 @@ def draw_text(
     font_size: float,
     color: Tuple[float, float, float],
     center: bool = False,
+    weight: cairo.FontWeight = cairo.FONT_WEIGHT_BOLD,
 ) -> None:
     """Draw text."""
-    ctx.select_font_face("Sans", cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_BOLD)
-    ctx.set_font_size(font_size)
+    ctx.set_scaled_font(get_scaled_font(font_size, weight))
     ctx.set_source_rgb(*color)
 
-    text_extents = ctx.text_extents(text)
+    text_extents = get_text_extents(text, font_size, weight)
     _width = width or 0
     text_x = round(
         x - (text_extents.width / 2 + text_extents.x_bearing) + _width / 2
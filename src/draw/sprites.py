@@ -0,0 +1,244 @@
+"""Pre-rendered minute counters."""
+
+import functools
+import json
+import logging
+import math
+import os
+import zlib
+from typing import Dict, List, Sequence, Tuple
+
+# pylint: disable=no-member
+# missing types because of C bindings
+import cairo
+
+from draw import pencil
+
+logger = logging.getLogger(__name__)
+
+# Where atlases are kept between runs
+CACHE_DIR = os.environ.get(
+    "TRAIN_DISPLAY_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "train-display"),
+)
+
+# Bump when the file layout or the way runs are drawn changes
+ATLAS_VERSION = 1
+
+# Blank pixels around each run so anti-aliased edges are not cut off
+PADDING = 2
+
+ATLAS_COLUMNS = 10
+
+
+def minute_texts(suffix: str) -> List[str]:
+    """List the runs shown for every minute count from 0 to 99, and none."""
+    return [f"{minutes}{suffix}" for minutes in ["--", *range(100)]]
+
+
+class SpriteAtlas:
+    """Alpha masks of text runs, laid out on a grid of equal cells.
+
+    Each run is drawn with its origin at the same spot in its cell, so it can be
+    placed by lining that spot up with where draw_text would put the origin.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        surface: cairo.ImageSurface,
+        texts: Sequence[str],
+        *,
+        font_size: float,
+        weight: cairo.FontWeight,
+        cell_size: Tuple[int, int],
+        origin: Tuple[int, int],
+    ) -> None:
+        self.surface = surface
+        self.cells: Dict[str, int] = {text: i for i, text in enumerate(texts)}
+        self.font_size = font_size
+        self.weight = weight
+        self.cell_width, self.cell_height = cell_size
+        self.origin_x, self.origin_y = origin
+
+    @classmethod
+    def render(
+        cls, texts: Sequence[str], *, font_size: float, weight: cairo.FontWeight
+    ) -> "SpriteAtlas":
+        """Draw every run into a new atlas."""
+        extents = [pencil.get_text_extents(text, font_size, weight) for text in texts]
+        left = min(0, math.floor(min(e.x_bearing for e in extents)))
+        right = math.ceil(max(e.x_bearing + e.width for e in extents))
+        top = math.floor(min(e.y_bearing for e in extents))
+        bottom = math.ceil(max(e.y_bearing + e.height for e in extents))
+
+        origin = (PADDING - left, PADDING - top)
+        cell_width = right - left + 2 * PADDING
+        cell_height = bottom - top + 2 * PADDING
+        rows = math.ceil(len(texts) / ATLAS_COLUMNS)
+
+        surface = cairo.ImageSurface(
+            cairo.FORMAT_A8, ATLAS_COLUMNS * cell_width, rows * cell_height
+        )
+        ctx = cairo.Context(surface)
+        ctx.set_scaled_font(pencil.get_scaled_font(font_size, weight))
+        for i, text in enumerate(texts):
+            column, row = i % ATLAS_COLUMNS, i // ATLAS_COLUMNS
+            ctx.move_to(column * cell_width + origin[0], row * cell_height + origin[1])
+            ctx.show_text(text)
+        surface.flush()
+
+        return cls(
+            surface,
+            texts,
+            font_size=font_size,
+            weight=weight,
+            cell_size=(cell_width, cell_height),
+            origin=origin,
+        )
+
+    @classmethod
+    def load(
+        cls,
+        path: str,
+        texts: Sequence[str],
+        *,
+        font_size: float,
+        weight: cairo.FontWeight,
+    ) -> "SpriteAtlas | None":
+        """Read an atlas saved by save, if it still matches the current font."""
+        try:
+            with open(path, "rb") as file:
+                header = json.loads(file.readline())
+                data = bytearray(zlib.decompress(file.read()))
+        except (OSError, ValueError, zlib.error):
+            return None
+
+        if header.get("fingerprint") != fingerprint(texts, font_size, weight):
+            return None
+
+        width, height, stride = header["width"], header["height"], header["stride"]
+        if len(data) != stride * height:
+            return None
+        surface = cairo.ImageSurface.create_for_data(
+            data, cairo.FORMAT_A8, width, height, stride
+        )
+        return cls(
+            surface,
+            texts,
+            font_size=font_size,
+            weight=weight,
+            cell_size=tuple(header["cell_size"]),
+            origin=tuple(header["origin"]),
+        )
+
+    def save(self, path: str) -> None:
+        """Write the atlas to disk so later runs can skip rendering it."""
+        self.surface.flush()
+        header = {
+            "fingerprint": fingerprint(list(self.cells), self.font_size, self.weight),
+            "width": self.surface.get_width(),
+            "height": self.surface.get_height(),
+            "stride": self.surface.get_stride(),
+            "cell_size": [self.cell_width, self.cell_height],
+            "origin": [self.origin_x, self.origin_y],
+        }
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "wb") as file:
+            file.write(json.dumps(header).encode() + b"\n")
+            file.write(zlib.compress(bytes(self.surface.get_data())))
+        os.replace(temporary_path, path)
+
+    # pylint: disable=too-many-arguments
+    def draw(
+        self,
+        ctx: cairo.Context,
+        *,
+        text: str,
+        x: float,
+        y: float,
+        height: float,
+        color: Tuple[float, float, float],
+    ) -> bool:
+        """Copy a run to where draw_text would draw it, if the atlas has it."""
+        index = self.cells.get(text)
+        if index is None:
+            return False
+
+        extents = pencil.get_text_extents(text, self.font_size, self.weight)
+        text_x = round(x)
+        text_y = round(y - (extents.height / 2 + extents.y_bearing) + height / 2)
+        left = text_x - self.origin_x
+        top = text_y - self.origin_y
+        cell_x = (index % ATLAS_COLUMNS) * self.cell_width
+        cell_y = (index // ATLAS_COLUMNS) * self.cell_height
+
+        ctx.save()
+        ctx.rectangle(left, top, self.cell_width, self.cell_height)
+        ctx.clip()
+        ctx.set_source_rgb(*color)
+        ctx.mask_surface(self.surface, left - cell_x, top - cell_y)
+        ctx.restore()
+        return True
+
+
+def fingerprint(
+    texts: Sequence[str], font_size: float, weight: cairo.FontWeight
+) -> List:
+    """Describe what an atlas was rendered from, to spot stale files."""
+    sample = pencil.get_text_extents("".join(texts[:11]), font_size, weight)
+    return [
+        ATLAS_VERSION,
+        cairo.cairo_version(),
+        pencil.FONT_FAMILY,
+        font_size,
+        int(weight),
+        list(texts),
+        list(sample),
+    ]
+
+
+@functools.lru_cache(maxsize=8)
+def get_minutes_atlas(font_size: float, suffix: str) -> SpriteAtlas:
+    """Get the minute counter atlas for a size, loading or building it once."""
+    texts = minute_texts(suffix)
+    weight = cairo.FONT_WEIGHT_BOLD
+    name = f"minutes-{font_size:g}-{zlib.crc32(suffix.encode()):08x}.atlas"
+    path = os.path.join(CACHE_DIR, name)
+
+    atlas = SpriteAtlas.load(path, texts, font_size=font_size, weight=weight)
+    if atlas is None:
+        atlas = SpriteAtlas.render(texts, font_size=font_size, weight=weight)
+        try:
+            atlas.save(path)
+        except OSError as e:
+            logger.warning(f"Could not save sprite atlas: {e}")
+    return atlas
+
+
+# pylint: disable=too-many-arguments
+def draw_minutes(
+    ctx: cairo.Context,
+    *,
+    minutes: int | None,
+    suffix: str = "",
+    x: float,
+    y: float,
+    height: float,
+    font_size: float,
+    color: Tuple[float, float, float],
+) -> None:
+    """Draw a minute count the way draw_text would, from the atlas if possible."""
+    text = f"{minutes if minutes is not None else '--'}{suffix}"
+    atlas = get_minutes_atlas(font_size, suffix)
+    if not atlas.draw(ctx, text=text, x=x, y=y, height=height, color=color):
+        pencil.draw_text(
+            ctx,
+            text=text,
+            x=x,
+            y=y,
+            height=height,
+            font_size=font_size,
+            color=color,
+        )
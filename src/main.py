@@ -1,37 +1,176 @@
 """Create subway time images."""
 
-import time
+import argparse
+import asyncio
+import functools
 import logging
+import signal
+from typing import Dict
 
 import draw
-import subway_client
+import metrics
+import profiling
+import scheduler
 from display_connector import DisplayConnector
 
 logger = logging.getLogger(__name__)
 output_path = "outputs/output.png"
+profile_dir = "outputs/profiles"
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--debug-png",
+        nargs="?",
+        const=output_path,
+        default=None,
+        metavar="PATH",
+        help=f"also write each frame to a PNG file (default: {output_path})",
+    )
+    parser.add_argument(
+        "--min-refresh-interval",
+        type=float,
+        default=0,
+        metavar="SECONDS",
+        help="minimum time between two full panel refreshes (default: 0)",
+    )
+    parser.add_argument(
+        "--metrics",
+        default=None,
+        metavar="PATH",
+        help="write stage timings here after every render, in the Prometheus "
+        "text format if PATH ends in .prom, JSON otherwise",
+    )
+    parser.add_argument(
+        "--platform",
+        choices=("raspberrypi", "jetson", "sunrise", "simulated"),
+        default=None,
+        help="board driving the panel, or simulated to run without one "
+        "(default: detected, or $EPD_PLATFORM)",
+    )
+    parser.add_argument(
+        "--spi-speed",
+        type=int,
+        default=None,
+        metavar="HZ",
+        help="SPI clock for the panel (default: the platform's, usually 4000000)",
+    )
+    parser.add_argument(
+        "--spi-chunk-size",
+        type=int,
+        default=None,
+        metavar="BYTES",
+        help="bytes sent to the SPI driver per transfer (default: 4096)",
+    )
+    parser.add_argument(
+        "--fetch-interval",
+        type=float,
+        default=scheduler.FETCH_INTERVAL,
+        metavar="SECONDS",
+        help=f"time between polls of the feeds (default: {scheduler.FETCH_INTERVAL})",
+    )
+    parser.add_argument(
+        "--profile",
+        type=int,
+        default=0,
+        metavar="CYCLES",
+        help="profile this many render cycles from the start. SIGUSR1 profiles "
+        f"the next ones at any time (default: 0, or {profiling.CYCLES} on SIGUSR1)",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        default=profile_dir,
+        metavar="PATH",
+        help=f"where profiles are written (default: {profile_dir})",
+    )
+    parser.add_argument(
+        "--profile-sampling-only",
+        action="store_true",
+        help="only sample stacks while profiling, leaving out cProfile, which "
+        "slows the profiled cycles down",
+    )
+    return parser.parse_args()
 
 
 def main() -> None:
     """Check subway times, generate image, and write to display"""
+    args = parse_args()
 
-    display_connector = DisplayConnector()
+    display_connector = DisplayConnector(
+        min_refresh_interval=args.min_refresh_interval,
+        spi_speed_hz=args.spi_speed,
+        spi_chunk_size=args.spi_chunk_size,
+        platform=args.platform,
+    )
     display_connector.init()
 
-    while True:
-        try:
-            times = subway_client.fetch_subway_times()
-            alerts = subway_client.fetch_status_data()
-
-            draw.create_subway_time_image(output_path, times, alerts)
-            logger.info(f"Subway time image saved to: {output_path}")
-            display_connector.display_image(output_path)
-
-            time.sleep(60)
-        except KeyboardInterrupt:    
-            display_connector.cleanup()
-            exit()
-        except Exception as e:
-            logger.warning(e)
+    try:
+        asyncio.run(run(display_connector, args))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        display_connector.cleanup()
+
+
+async def run(display_connector: DisplayConnector, args: argparse.Namespace) -> None:
+    """Fetch and draw on wall-clock minutes until interrupted or terminated."""
+    profiler = profiling.Profiler(
+        args.profile_dir,
+        args.profile or profiling.CYCLES,
+        use_cprofile=not args.profile_sampling_only,
+    )
+    if args.profile:
+        profiler.request()
+
+    tasks = scheduler.Scheduler(
+        functools.partial(
+            render,
+            display_connector,
+            debug_png=args.debug_png,
+            metrics_path=args.metrics,
+        ),
+        fetch_interval=args.fetch_interval,
+        on_render_tick=profiler.tick,
+    )
+
+    # Stop the same way on SIGTERM as on Ctrl+C
+    loop = asyncio.get_running_loop()
+    main_task = asyncio.current_task()
+    if main_task is not None:
+        loop.add_signal_handler(signal.SIGTERM, main_task.cancel)
+    loop.add_signal_handler(signal.SIGUSR1, profiler.request)
+
+    try:
+        await tasks.run()
+    except asyncio.CancelledError:
+        logger.info("Stopping")
+    finally:
+        profiler.stop()
+
+
+def render(
+    display_connector: DisplayConnector,
+    times: scheduler.Times,
+    alerts: Dict,
+    debug_png: str | None,
+    metrics_path: str | None = None,
+) -> None:
+    """Draw the board from the given data and hand it to the display."""
+    with metrics.span("render"):
+        surface = draw.generate_subway_time_image(times, alerts)
+    if debug_png:
+        draw.save_subway_time_image(surface, debug_png)
+        logger.info(f"Subway time image saved to: {debug_png}")
+    # the display connector reads the surface when it gets to it, so it is
+    # left for it to release rather than finished here
+    display_connector.submit_surface(surface)
+
+    # Written before this frame reaches the panel, so it covers the stages of
+    # the cycles before this one
+    if metrics_path:
+        metrics.export(metrics_path)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,130 @@
+"""Timing spans for each stage of the fetch, render and display cycle."""
+
+import contextlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Iterator, List, Tuple
+
+# Most recent samples kept per stage for the percentiles
+WINDOW = 256
+
+# Name of the exported Prometheus metric
+METRIC_NAME = "train_display_stage_seconds"
+
+# (stage name, sorted (label, value) pairs)
+SeriesKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class Histogram:
+    """Rolling window of durations for one stage, with running totals."""
+
+    def __init__(self, window: int = WINDOW) -> None:
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def summary(self) -> Dict[str, float]:
+        """Get the p50, p95 and max of the window, and the running totals."""
+        ordered = sorted(self.samples)
+        return {
+            "p50": percentile(ordered, 0.5),
+            "p95": percentile(ordered, 0.95),
+            "max": ordered[-1] if ordered else 0.0,
+            "count": self.count,
+            "sum": self.total,
+        }
+
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    """Get a nearest-rank percentile of sorted samples."""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+_series: Dict[SeriesKey, Histogram] = {}
+_lock = threading.Lock()
+
+
+def record(stage: str, seconds: float, **labels: str) -> None:
+    """Add a duration to a stage, such as record("busy", 0.2, phase="refresh")."""
+    key = (stage, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _series.get(key)
+        if histogram is None:
+            histogram = _series[key] = Histogram()
+        histogram.add(seconds)
+
+
+@contextlib.contextmanager
+def span(stage: str, **labels: str) -> Iterator[None]:
+    """Time the body of a with block as one sample of a stage.
+
+    The sample is recorded even if the body raises, so failures that take a
+    long time show up too.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started, **labels)
+
+
+def snapshot() -> List[Dict]:
+    """Summarize every stage, as a list of {stage, labels, p50, p95, ...}."""
+    with _lock:
+        series = [(key, histogram.summary()) for key, histogram in _series.items()]
+    return [
+        {"stage": stage, "labels": dict(labels), **summary}
+        for (stage, labels), summary in sorted(series)
+    ]
+
+
+def to_prometheus(stages: List[Dict]) -> str:
+    """Format a snapshot in the Prometheus text exposition format."""
+    lines = [
+        f"# HELP {METRIC_NAME} Time spent in each stage of a display cycle.",
+        f"# TYPE {METRIC_NAME} summary",
+    ]
+    for stage in stages:
+        labels = {"stage": stage["stage"], **stage["labels"]}
+        label_text = ",".join(f'{name}="{value}"' for name, value in labels.items())
+        for quantile, key in (("0.5", "p50"), ("0.95", "p95"), ("1", "max")):
+            lines.append(
+                f'{METRIC_NAME}{{{label_text},quantile="{quantile}"}} {stage[key]:.6f}'
+            )
+        lines.append(f"{METRIC_NAME}_sum{{{label_text}}} {stage['sum']:.6f}")
+        lines.append(f"{METRIC_NAME}_count{{{label_text}}} {stage['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def write_atomically(path: str, text: str) -> None:
+    """Replace a file in one step, so readers never see half of it."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as file:
+        file.write(text)
+    os.replace(temporary_path, path)
+
+
+def export(path: str) -> None:
+    """Write a snapshot of every stage to a file.
+
+    Paths ending in .prom get the Prometheus format, for node_exporter's
+    textfile collector. Anything else gets JSON.
+    """
+    stages = snapshot()
+    if path.endswith(".prom"):
+        write_atomically(path, to_prometheus(stages))
+    else:
+        write_atomically(path, json.dumps({"time": time.time(), "stages": stages}))
@@ -0,0 +1,268 @@
+"""Profile a few display cycles on demand, without restarting the display.
+
+A cycle runs from one render tick to the next, so it covers the render, the
+refresh it hands to the display thread and any fetch in between. While a cycle
+is profiled, every thread is profiled with cProfile and its stacks are sampled
+for a flame graph, and tracemalloc tracks where memory is allocated. Each cycle
+leaves three files in the session directory:
+
+    cycle-001.prof    cProfile stats, for pstats or snakeviz
+    cycle-001.folded  collapsed stacks, for flamegraph.pl or speedscope
+    cycle-001.json    wall time, peak RSS and the top allocation sites
+
+stacks.folded adds up the stacks of every cycle in the session.
+"""
+
+import collections
+import cProfile
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from types import FrameType
+from typing import Counter, Dict, List
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Cycles profiled when profiling is requested without saying how many
+CYCLES = 3
+
+# Seconds between two stack samples
+SAMPLE_INTERVAL = 0.01
+
+# Allocation sites listed in each cycle's summary
+TOP_ALLOCATIONS = 15
+
+# Frames of the profiler itself, left out of the allocation sites
+OWN_FILES = (tracemalloc.__file__, __file__)
+
+
+def frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    return (
+        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    )
+
+
+def folded(counts: Counter[str]) -> str:
+    """Format stack counts as collapsed stacks, one "a;b;c count" per line."""
+    return "".join(f"{stack} {count}\n" for stack, count in counts.items())
+
+
+class StackSampler:
+    """Count the stacks every other thread is in, on a timer.
+
+    The counts are wall-clock, so threads waiting on the panel or the network
+    show up as much as threads using the CPU. Each stack starts with its
+    thread's name, so the flame graph splits by thread.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL) -> None:
+        self.interval = interval
+        self.counts: Counter[str] = collections.Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run, name="stack-sampler", daemon=True
+        )
+
+    @staticmethod
+    def available() -> bool:
+        return hasattr(sys, "_current_frames")
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self) -> None:
+        own = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            # pylint: disable=protected-access
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                current: FrameType | None = frame
+                while current is not None:
+                    stack.append(frame_label(current))
+                    current = current.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.counts[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+
+# pylint: disable=too-many-instance-attributes
+class Profiler:
+    """Profile the next few cycles when asked to.
+
+    request can be called at any time, such as from a signal handler, and the
+    profiling starts on the next render tick, which has to call tick.
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        cycles: int = CYCLES,
+        *,
+        use_cprofile: bool = True,
+        sample_interval: float = SAMPLE_INTERVAL,
+    ) -> None:
+        self.output_dir = output_dir
+        self.cycles = cycles
+        self.use_cprofile = use_cprofile
+        self.sample_interval = sample_interval
+
+        self.lock = threading.Lock()
+        self.requested = 0
+        self.session_dir: str | None = None
+        self.cycle = 0
+        self.total_stacks: Counter[str] = collections.Counter()
+        self.stopped_tracemalloc = False
+
+        # state of the cycle being profiled
+        self.started = 0.0
+        self.profile: cProfile.Profile | None = None
+        self.sampler: StackSampler | None = None
+        self.allocations: tracemalloc.Snapshot | None = None
+
+    @property
+    def active(self) -> bool:
+        return self.started > 0
+
+    def request(self, cycles: int | None = None) -> None:
+        """Profile this many more cycles, starting on the next tick."""
+        with self.lock:
+            self.requested += self.cycles if cycles is None else cycles
+            logger.info(f"Profiling the next {self.requested} cycles")
+
+    def tick(self) -> None:
+        """End the cycle being profiled, and start the next one if asked to."""
+        if self.active:
+            self.finish_cycle()
+        with self.lock:
+            if self.requested <= 0:
+                if self.session_dir is not None:
+                    self.finish_session()
+                return
+            self.requested -= 1
+        self.start_cycle()
+
+    def stop(self) -> None:
+        """Write out a cycle that is still running, and drop any requests."""
+        with self.lock:
+            self.requested = 0
+        self.tick()
+
+    def start_cycle(self) -> None:
+        if self.session_dir is None:
+            self.session_dir = os.path.join(
+                self.output_dir, time.strftime("%Y%m%d-%H%M%S")
+            )
+            os.makedirs(self.session_dir, exist_ok=True)
+            self.cycle = 0
+            self.total_stacks.clear()
+            self.stopped_tracemalloc = not tracemalloc.is_tracing()
+            if self.stopped_tracemalloc:
+                tracemalloc.start()
+        self.cycle += 1
+
+        tracemalloc.reset_peak()
+        self.allocations = self.take_snapshot()
+        if self.use_cprofile:
+            self.profile = cProfile.Profile()
+            try:
+                # covers every thread from Python 3.12, which profiles through
+                # sys.monitoring
+                self.profile.enable()
+            except ValueError as e:
+                logger.warning(f"Could not start cProfile: {e}")
+                self.profile = None
+        if StackSampler.available():
+            self.sampler = StackSampler(self.sample_interval)
+            self.sampler.start()
+        self.started = time.perf_counter()
+
+    def finish_cycle(self) -> None:
+        seconds = time.perf_counter() - self.started
+        self.started = 0.0
+        if self.profile is not None:
+            self.profile.disable()
+        if self.sampler is not None:
+            self.sampler.stop()
+        current, peak = tracemalloc.get_traced_memory()
+
+        assert self.session_dir is not None
+        path = os.path.join(self.session_dir, f"cycle-{self.cycle:03d}")
+        summary = {
+            "cycle": self.cycle,
+            "seconds": seconds,
+            # kilobytes on Linux, for the whole life of the process
+            "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "traced_bytes": current,
+            "traced_peak_bytes": peak,
+            "samples": self.sampler.samples if self.sampler is not None else 0,
+            "allocations": self.allocation_sites(),
+            "stages": metrics.snapshot(),
+        }
+        metrics.write_atomically(f"{path}.json", json.dumps(summary, indent=1))
+        if self.profile is not None:
+            self.profile.dump_stats(f"{path}.prof")
+        if self.sampler is not None:
+            metrics.write_atomically(f"{path}.folded", folded(self.sampler.counts))
+            self.total_stacks.update(self.sampler.counts)
+            metrics.write_atomically(
+                os.path.join(self.session_dir, "stacks.folded"),
+                folded(self.total_stacks),
+            )
+        logger.info(
+            f"Profiled cycle {self.cycle} in {seconds:.1f}s, "
+            f"peak RSS {summary['peak_rss_kb']}kB, "
+            f"traced peak {peak / 1024:.0f}kB, written to {path}.*"
+        )
+        self.profile = None
+        self.sampler = None
+        self.allocations = None
+
+    def finish_session(self) -> None:
+        # tracemalloc slows every allocation down, so it only runs while
+        # profiling unless something else started it
+        if self.stopped_tracemalloc:
+            tracemalloc.stop()
+        logger.info(f"Profiling done, {self.cycle} cycles in {self.session_dir}")
+        self.session_dir = None
+
+    @staticmethod
+    def take_snapshot() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, path) for path in OWN_FILES]
+        )
+
+    def allocation_sites(self) -> List[Dict]:
+        """List the lines that allocated the most during the cycle.
+
+        Memory freed again before the cycle ended is not counted, so these are
+        the allocations a cycle keeps, which is where leaks show up.
+        """
+        if self.allocations is None:
+            return []
+        differences = self.take_snapshot().compare_to(self.allocations, "lineno")
+        return [
+            {
+                "where": str(difference.traceback),
+                "bytes": difference.size,
+                "bytes_added": difference.size_diff,
+                "blocks": difference.count,
+                "blocks_added": difference.count_diff,
+            }
+            for difference in differences[:TOP_ALLOCATIONS]
+        ]
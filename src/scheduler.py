@@ -0,0 +1,227 @@
+"""Fetch and render on separate cadences, aligned to the wall clock."""
+
+import asyncio
+import logging
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+
+import metrics
+import subway_client
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two polls of the MTA feeds
+FETCH_INTERVAL = 60
+
+# Seconds between two redraws of the board
+RENDER_INTERVAL = 60
+
+# How long before each render tick the feeds are polled, so the board is drawn
+# from fresh data. A fetch still running when the render tick comes is given up.
+FETCH_LEAD = subway_client.REQUEST_TIMEOUT + 5
+
+# direction -> route_id -> departure timestamps
+Times = Dict[str, Dict[str, List[int]]]
+
+
+def next_tick(interval: float, offset: float = 0, now: float | None = None) -> float:
+    """Get the next wall-clock time that is a whole multiple of the interval.
+
+    Args:
+        interval: Seconds between ticks
+        offset: Seconds to shift every tick by, such as -5 for 5s before each one
+        now: The time to start from, defaults to the current time
+    """
+    if now is None:
+        now = time.time()
+    return (math.floor((now - offset) / interval) + 1) * interval + offset
+
+
+async def sleep_until(wall_time: float) -> float:
+    """Sleep until a wall-clock time.
+
+    Returns:
+        How many seconds late the wake up was
+    """
+    await asyncio.sleep(max(0.0, wall_time - time.time()))
+    return time.time() - wall_time
+
+
+class TickStats:
+    """Track how late a loop's ticks run compared to when they were due."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.ticks = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.overruns = 0
+
+    def record(self, lag: float) -> None:
+        self.ticks += 1
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        logger.info(f"{self.name} tick ran {lag * 1000:.1f}ms late")
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "ticks": self.ticks,
+            "last_lag": self.last_lag,
+            "max_lag": self.max_lag,
+            "overruns": self.overruns,
+        }
+
+
+class ArrivalStore:
+    """Latest fetched departures and alerts.
+
+    The board only needs absolute departure timestamps, so it can be drawn again
+    from the last fetch at any time and the minutes shown stay right even when
+    fetching is slow or failing.
+    """
+
+    def __init__(self) -> None:
+        self.data: Tuple[Times, Dict] | None = None
+        self.fetched_at: float | None = None
+        self.arrived = asyncio.Event()
+
+    def update(self, times: Times, alerts: Dict) -> None:
+        """Replace the stored data."""
+        self.data = (times, alerts)
+        self.fetched_at = time.time()
+        self.arrived.set()
+
+    def age(self) -> float | None:
+        """Get how many seconds ago the stored data was fetched."""
+        return None if self.fetched_at is None else time.time() - self.fetched_at
+
+
+# pylint: disable=too-many-instance-attributes
+class Scheduler:
+    """Run the fetch and render loops on one event loop.
+
+    Both loops wake up on wall-clock boundaries instead of sleeping a fixed time
+    after their work, so their period does not drift by however long the work
+    took. The blocking work runs on one worker thread per loop, so a slow
+    fetch never holds up drawing and two renders never overlap.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        render: Callable[[Times, Dict], Any],
+        *,
+        fetch: Callable[[], Tuple[Times, Dict]] = subway_client.fetch_all,
+        fetch_interval: float = FETCH_INTERVAL,
+        render_interval: float = RENDER_INTERVAL,
+        fetch_lead: float = FETCH_LEAD,
+        on_render_tick: Callable[[], Any] | None = None,
+    ) -> None:
+        self.render = render
+        self.fetch = fetch
+        self.fetch_interval = fetch_interval
+        self.render_interval = render_interval
+        self.fetch_lead = fetch_lead
+        # called on the event loop at the start of every render tick
+        self.on_render_tick = on_render_tick
+        self.store = ArrivalStore()
+        self.fetch_stats = TickStats("fetch")
+        self.render_stats = TickStats("render")
+        self.fetch_executor = ThreadPoolExecutor(1, thread_name_prefix="fetch")
+        self.render_executor = ThreadPoolExecutor(1, thread_name_prefix="render")
+
+    async def run(self) -> None:
+        """Run both loops until cancelled, then wait for a refresh in flight."""
+        try:
+            async with asyncio.TaskGroup() as tasks:
+                tasks.create_task(self.fetch_loop())
+                tasks.create_task(self.render_loop())
+        finally:
+            # Worker threads cannot be interrupted, so let a render that has
+            # started hand its frame over before the caller cleans up
+            self.fetch_executor.shutdown(wait=False, cancel_futures=True)
+            self.render_executor.shutdown(wait=True, cancel_futures=True)
+            logger.info(f"Tick stats: {self.tick_stats()}")
+
+    async def fetch_loop(self) -> None:
+        # Fetch once right away so the board does not wait a whole interval
+        await self.fetch_once(self.fetch_lead)
+        while True:
+            tick = next_tick(self.fetch_interval, -self.fetch_lead)
+            self.fetch_stats.record(await sleep_until(tick))
+            await self.fetch_once(tick + self.fetch_lead - time.time())
+
+    async def fetch_once(self, timeout: float) -> None:
+        """Poll every feed once, keeping the old data if it fails or is late."""
+        loop = asyncio.get_running_loop()
+        try:
+            async with asyncio.timeout(max(0.0, timeout)):
+                times, alerts = await loop.run_in_executor(
+                    self.fetch_executor, self.timed_fetch
+                )
+        except TimeoutError:
+            self.fetch_stats.overruns += 1
+            logger.warning("Fetch missed its deadline, keeping the last data")
+            return
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.warning(f"Fetch failed, keeping the last data: {e}")
+            return
+
+        self.store.update(times, alerts)
+        logger.info(f"Feed stats: {subway_client.session.stats()}")
+        logger.info(f"Unchanged feeds: {subway_client.get_feed_stats()}")
+
+    def timed_fetch(self) -> Tuple[Times, Dict]:
+        with metrics.span("fetch"):
+            return self.fetch()
+
+    async def render_loop(self) -> None:
+        # Draw as soon as the first data is in, then once per tick
+        await self.store.arrived.wait()
+        self.start_render_tick()
+        await self.render_once(self.render_interval)
+        while True:
+            tick = next_tick(self.render_interval)
+            self.render_stats.record(await sleep_until(tick))
+            self.start_render_tick()
+            await self.render_once(tick + self.render_interval - time.time())
+
+    def start_render_tick(self) -> None:
+        if self.on_render_tick is None:
+            return
+        try:
+            self.on_render_tick()
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.warning(f"Render tick hook failed: {e}")
+
+    async def render_once(self, timeout: float) -> None:
+        """Draw the board from the stored data and send it to the display.
+
+        A render that runs past its deadline is not abandoned, since it may
+        still be handing a frame to the display, but the ticks it ran over are
+        skipped.
+        """
+        if self.store.data is None:
+            return
+        logger.info(f"Drawing from data fetched {self.store.age():.0f}s ago")
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            self.render_executor, self.render, *self.store.data
+        )
+        done, _ = await asyncio.wait([future], timeout=max(0.0, timeout))
+        if not done:
+            self.render_stats.overruns += 1
+            logger.warning("Render missed its deadline, waiting for it to finish")
+            await asyncio.wait([future])
+        if future.exception() is not None:
+            logger.warning(f"Render failed: {future.exception()}")
+
+    def tick_stats(self) -> Dict[str, Dict[str, float]]:
+        """Get how late each loop's ticks have run."""
+        return {
+            "fetch": self.fetch_stats.as_dict(),
+            "render": self.render_stats.as_dict(),
+        }
@@ -1,12 +1,22 @@
 # pylint: disable=import-error
 """Client for fetching subway times from the MTA API."""
 
+import bisect
+import json
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List
+from typing import Any, Callable, Dict, Iterable, List, Tuple
 
-import requests
 from google.transit import gtfs_realtime_pb2
 
+import metrics
+from subway_client.session import FeedSession
+
+logger = logging.getLogger(__name__)
+
 FEED_NQRW = "https://api-endpoint.mta.info/Dataservice/mtagtfsfeeds/nyct%2Fgtfs-nqrw"
 FEED_BDFM = "https://api-endpoint.mta.info/Dataservice/mtagtfsfeeds/nyct%2Fgtfs-bdfm"
 FEED_123 = "https://api-endpoint.mta.info/Dataservice/mtagtfsfeeds/nyct%2Fgtfs"
@@ -15,86 +25,311 @@ STATUS_URL = (
     "https://api-endpoint.mta.info/Dataservice/mtagtfsfeeds/camsys%2Fsubway-alerts.json"
 )
 
+# Stations shown on the board, by feed, as route -> stop id without direction
+STOPS = {
+    FEED_123: {"2": "237", "3": "237"},
+    FEED_BDFM: {"B": "D25"},
+    FEED_NQRW: {"Q": "D25"},
+}
+DIRECTIONS = ("N", "S")
+
+FEEDS = tuple(STOPS)
+
+# Lines whose status is shown on the board
+STATUS_ROUTES = tuple(route_id for routes in STOPS.values() for route_id in routes)
+
+# Alerts for other agencies, such as buses, share the feed
+AGENCY_ID = "MTASBWY"
+
+# (stop_id, route_id) -> sorted departure timestamps
+ArrivalIndex = Dict[Tuple[str, str], Tuple[int, ...]]
+
+# route_id -> active alerts, in feed order
+AlertIndex = Dict[str, List[Dict]]
+
+# Seconds each request may take before the cycle gives up on it
+REQUEST_TIMEOUT = 10
+
+# Kept open across cycles so polling reuses connections and cached feeds
+session = FeedSession(pool_size=len(FEEDS) + 1)
+
+# feed_url -> (feed the index was built from, its header timestamp, index)
+_arrival_indexes: Dict[str, Tuple[Any, int, ArrivalIndex]] = {}
+
+# feed_url -> how often it was polled, how often it had not moved on and how
+# often its request from an earlier cycle was still running
+feed_stats: Dict[str, Dict[str, int]] = {
+    url: {"polls": 0, "unchanged": 0, "still_running": 0}
+    for url in (*FEEDS, STATUS_URL)
+}
+
+# One worker per feed plus one for the alerts, so every request runs at once.
+# No feed has more than one request running at a time, see submit_request.
+_executor = ThreadPoolExecutor(
+    max_workers=len(FEEDS) + 1, thread_name_prefix="subway-client"
+)
+
+# feed_url -> the request last started for it
+_in_flight: Dict[str, Future] = {}
+_in_flight_lock = threading.Lock()
+
+
+def is_alert_active(alert: Dict, now: int) -> bool:
+    """Check whether any of an alert's active periods covers a point in time.
+
+    An alert without active periods is always active.
+    """
+    periods = alert.get("active_period")
+    if not periods:
+        return True
+    return any(
+        period.get("start", 0) <= now <= period.get("end", float("inf"))
+        for period in periods
+    )
 
-def find_alert_for_line(line: str, alerts: Dict) -> Dict | None:
+
+def build_alert_index(
+    alerts: List[Dict], routes: Iterable[str] | None = None, now: int | None = None
+) -> AlertIndex:
+    """Group the active subway alerts by route in one pass over the feed.
+
+    Args:
+        alerts: The entities of the alerts feed
+        routes: Only index these routes, or every route if None
+        now: The time to check active periods against, defaults to the current time
+    """
+    if now is None:
+        now = int(datetime.now().timestamp())
+    wanted = set(routes) if routes is not None else None
+
+    index: AlertIndex = {}
+    for entity in alerts:
+        alert = entity["alert"]
+        if not is_alert_active(alert, now):
+            continue
+        matched = set()
+        for informed_entity in alert["informed_entity"]:
+            route_id = informed_entity.get("route_id")
+            if (
+                route_id is None
+                or route_id in matched
+                or informed_entity.get("agency_id") != AGENCY_ID
+                or (wanted is not None and route_id not in wanted)
+            ):
+                continue
+            matched.add(route_id)
+            index.setdefault(route_id, []).append(alert)
+    return index
+
+
+def find_alert_for_line(line: str, alerts: List[Dict]) -> Dict | None:
     """Find the alert for a given line."""
-    for alert in alerts:
-        entities = alert["alert"]["informed_entity"]
-        for entity in entities:
-            now = int(datetime.now().timestamp())
-            active_period = alert["alert"].get("active_period", [None])[0]
-            if entity.get("route_id") == line and entity.get("agency_id") == "MTASBWY":
-                if active_period is None or (
-                    active_period.get("start", 0)
-                    <= now
-                    <= active_period.get("end", float("inf"))
-                ):
-                    return alert["alert"]
-    return None
-
-
-def fetch_status_data() -> Dict:
+    matches = build_alert_index(alerts, [line]).get(line)
+    return matches[0] if matches else None
+
+
+def fetch_alert_entities(timeout: float) -> List[Dict]:
+    """Fetch the entities of the alerts feed, counting unchanged polls."""
+    stats = feed_stats[STATUS_URL]
+    previous = session.cached(STATUS_URL)
+    response = session.get(STATUS_URL, json.loads, timeout)
+    stats["polls"] += 1
+    stats["unchanged"] += response is previous
+    return response["entity"]
+
+
+def fetch_alerts(timeout: float = REQUEST_TIMEOUT) -> AlertIndex:
+    """Fetch every active subway alert from the MTA API, grouped by route."""
+    return build_alert_index(fetch_alert_entities(timeout))
+
+
+def fetch_status_data(timeout: float = REQUEST_TIMEOUT) -> Dict:
     """Fetch status data from the MTA API."""
-    response = requests.get(STATUS_URL, timeout=10).json()
-    alerts = response["entity"]
+    alerts = fetch_alert_entities(timeout)
+    with metrics.span("alerts"):
+        index = build_alert_index(alerts, STATUS_ROUTES)
     return {
-        "2": find_alert_for_line("2", alerts),
-        "3": find_alert_for_line("3", alerts),
-        "B": find_alert_for_line("B", alerts),
-        "Q": find_alert_for_line("Q", alerts),
+        route_id: index[route_id][0] if route_id in index else None
+        for route_id in STATUS_ROUTES
     }
 
 
-def fetch_subway_data(feed_url: str) -> gtfs_realtime_pb2.FeedMessage:
+def fetch_subway_data(
+    feed_url: str, timeout: float = REQUEST_TIMEOUT
+) -> gtfs_realtime_pb2.FeedMessage:
     """Fetch subway data from the MTA API."""
+    return session.get(feed_url, parse_feed, timeout)
+
+
+def parse_feed(content: bytes) -> gtfs_realtime_pb2.FeedMessage:
+    """Parse a GTFS-realtime feed."""
     feed = gtfs_realtime_pb2.FeedMessage()
-    response = requests.get(feed_url, timeout=10)
-    feed.ParseFromString(response.content)
+    feed.ParseFromString(content)
     return feed
 
 
+def build_arrival_index(
+    feed: gtfs_realtime_pb2.FeedMessage, stops: Iterable[Tuple[str, str]]
+) -> ArrivalIndex:
+    """Collect departures for many (stop_id, route_id) pairs in one pass.
+
+    Every departure is kept, past or not, so an index stays valid as time goes
+    on. Use upcoming_departures to read it.
+    """
+    departures: Dict[Tuple[str, str], List[int]] = {stop: [] for stop in stops}
+    routes = {route_id for _, route_id in departures}
+
+    for entity in feed.entity:
+        if not entity.HasField("trip_update"):
+            continue
+        route_id = entity.trip_update.trip.route_id
+        if route_id not in routes:
+            continue
+        for stop_time_update in entity.trip_update.stop_time_update:
+            times = departures.get((stop_time_update.stop_id, route_id))
+            if times is not None:
+                times.append(stop_time_update.departure.time)
+
+    return {stop: tuple(sorted(times)) for stop, times in departures.items()}
+
+
+def upcoming_departures(
+    index: ArrivalIndex, stop_id: str, route_id: str, now: int
+) -> List[int]:
+    """Get the departures from a stop that are still in the future."""
+    times = index.get((stop_id, route_id), ())
+    return list(times[bisect.bisect_right(times, now) :])
+
+
+def get_arrival_index(
+    feed_url: str,
+    feed: gtfs_realtime_pb2.FeedMessage,
+    stops: Iterable[Tuple[str, str]],
+) -> ArrivalIndex:
+    """Index a feed, reusing the last index if the feed has not moved on.
+
+    A feed has not moved on when it is the very object indexed last time, which
+    the session hands back for 304s and repeated bodies, or when its header
+    timestamp is no newer than that of the feed indexed last time.
+    """
+    stats = feed_stats[feed_url]
+    stats["polls"] += 1
+
+    timestamp = feed.header.timestamp
+    cached = _arrival_indexes.get(feed_url)
+    if cached is not None:
+        cached_feed, cached_timestamp, cached_index = cached
+        if cached_feed is feed or 0 < timestamp <= cached_timestamp:
+            stats["unchanged"] += 1
+            return cached_index
+
+    index = build_arrival_index(feed, stops)
+    _arrival_indexes[feed_url] = (feed, timestamp, index)
+    return index
+
+
+def get_feed_stats() -> Dict[str, Dict[str, int]]:
+    """Get how often each feed was polled and found unchanged."""
+    return {url: dict(stats) for url, stats in feed_stats.items()}
+
+
 def get_subway_data_for_stop(
     feed: gtfs_realtime_pb2.FeedMessage, stop_id: str, route_id: str
 ) -> List[int]:
     """Get subway data for a specific stop."""
-    times = []
+    index = build_arrival_index(feed, [(stop_id, route_id)])
+    return upcoming_departures(
+        index, stop_id, route_id, int(datetime.now().timestamp())
+    )
 
-    for entity in feed.entity:
-        if (
-            entity.HasField("trip_update")
-            and entity.trip_update.stop_time_update
-            and entity.trip_update.trip.route_id == route_id
-        ):
-            for stop_time_update in entity.trip_update.stop_time_update:
-                departure_time = stop_time_update.departure.time
-                if (
-                    stop_time_update.stop_id == stop_id
-                    and entity.trip_update.trip.route_id == route_id
-                    and departure_time > int(datetime.now().timestamp())
-                ):
-                    times.append(departure_time)
-    times.sort()
-    return times
 
+def collect_results(futures: Dict[str, Future], deadline: float) -> Dict[str, Any]:
+    """Wait for requests running in parallel, giving up at the deadline.
 
-def fetch_subway_times() -> Dict[str, Dict[str, List[int]]]:
-    """Fetch subway times for all stops."""
-    data_123 = fetch_subway_data(FEED_123)
-    data_bdfm = fetch_subway_data(FEED_BDFM)
-    data_nqrw = fetch_subway_data(FEED_NQRW)
-
-    times = {
-        "N": {
-            "B": get_subway_data_for_stop(data_bdfm, "D25N", "B"),
-            "Q": get_subway_data_for_stop(data_nqrw, "D25N", "Q"),
-            "2": get_subway_data_for_stop(data_123, "237N", "2"),
-            "3": get_subway_data_for_stop(data_123, "237N", "3"),
-        },
-        "S": {
-            "B": get_subway_data_for_stop(data_bdfm, "D25S", "B"),
-            "Q": get_subway_data_for_stop(data_nqrw, "D25S", "Q"),
-            "2": get_subway_data_for_stop(data_123, "237S", "2"),
-            "3": get_subway_data_for_stop(data_123, "237S", "3"),
-        },
+    Raises:
+        TimeoutError: A request was still running at the deadline
+    """
+    return {
+        key: future.result(timeout=max(0.0, deadline - time.monotonic()))
+        for key, future in futures.items()
     }
+
+
+def submit_request(url: str, function: Callable[..., Any], *args: Any) -> Future:
+    """Start a request for a feed, unless the last one for it is still running.
+
+    The requests timeout applies to each read rather than to the whole
+    response, so a server that trickles a response out can keep a request
+    going long after its cycle gave up on it. Waiting on that request again
+    keeps it from holding up a second one for the same feed, which would
+    queue behind it for a worker and miss its deadline too.
+    """
+    with _in_flight_lock:
+        future = _in_flight.get(url)
+        if future is not None and not future.done():
+            feed_stats[url]["still_running"] += 1
+            logger.warning(f"Still fetching {url} from an earlier cycle")
+            return future
+        future = _in_flight[url] = _executor.submit(function, *args)
+        return future
+
+
+def submit_feeds(timeout: float) -> Dict[str, Future]:
+    """Start fetching every subway feed in parallel."""
+    return {url: submit_request(url, fetch_subway_data, url, timeout) for url in FEEDS}
+
+
+def get_subway_times(
+    feeds: Dict[str, gtfs_realtime_pb2.FeedMessage],
+) -> Dict[str, Dict[str, List[int]]]:
+    """Get subway times for all stops from fetched feeds."""
+    with metrics.span("arrivals"):
+        return extract_subway_times(feeds)
+
+
+def extract_subway_times(
+    feeds: Dict[str, gtfs_realtime_pb2.FeedMessage],
+) -> Dict[str, Dict[str, List[int]]]:
+    now = int(datetime.now().timestamp())
+    times: Dict[str, Dict[str, List[int]]] = {direction: {} for direction in DIRECTIONS}
+
+    for feed_url, routes in STOPS.items():
+        stops = [
+            (stop_id + direction, route_id)
+            for route_id, stop_id in routes.items()
+            for direction in DIRECTIONS
+        ]
+        index = get_arrival_index(feed_url, feeds[feed_url], stops)
+        for route_id, stop_id in routes.items():
+            for direction in DIRECTIONS:
+                times[direction][route_id] = upcoming_departures(
+                    index, stop_id + direction, route_id, now
+                )
+
     return times
+
+
+def fetch_subway_times(
+    timeout: float = REQUEST_TIMEOUT,
+) -> Dict[str, Dict[str, List[int]]]:
+    """Fetch subway times for all stops."""
+    deadline = time.monotonic() + timeout
+    feeds = collect_results(submit_feeds(timeout), deadline)
+    return get_subway_times(feeds)
+
+
+def fetch_all(
+    timeout: float = REQUEST_TIMEOUT,
+) -> Tuple[Dict[str, Dict[str, List[int]]], Dict]:
+    """Fetch subway times and line statuses, with all requests in parallel.
+
+    Every request gets the same deadline, so the whole fetch takes about as long
+    as the slowest request and never much longer than the timeout.
+    """
+    deadline = time.monotonic() + timeout
+    futures = submit_feeds(timeout)
+    futures[STATUS_URL] = submit_request(STATUS_URL, fetch_status_data, timeout)
+
+    results = collect_results(futures, deadline)
+    alerts = results.pop(STATUS_URL)
+    return get_subway_times(results), alerts
@@ -0,0 +1,104 @@
+"""Shared HTTP session for polling the MTA feeds."""
+
+import hashlib
+import threading
+from typing import Any, Callable, Dict, Tuple, TypeVar
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+T = TypeVar("T")
+
+
+def feed_name(url: str) -> str:
+    """Shorten a feed URL to its last path part, such as gtfs-nqrw."""
+    return url.rsplit("%2F", 1)[-1].rsplit("/", 1)[-1]
+
+
+class FeedSession:
+    """Keep-alive HTTP session that revalidates feeds with conditional GETs.
+
+    The parsed payload of every feed is kept along with its ETag and
+    Last-Modified validators and a digest of its body. When the server answers
+    304 Not Modified, or sends the same body again, the previous payload object
+    is returned as is without parsing it again.
+    """
+
+    def __init__(self, pool_size: int = 4) -> None:
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+        self.session.headers["Accept-Encoding"] = "gzip, deflate"
+
+        # url -> (validators to send back, body digest, parsed payload)
+        self.cache: Dict[str, Tuple[Dict[str, str], bytes, Any]] = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.not_modified = 0
+        self.unchanged_bodies = 0
+        self.bytes_received = 0
+
+    def get(self, url: str, parse: Callable[[bytes], T], timeout: float) -> T:
+        """Fetch a feed and parse it, reusing the last payload if unchanged."""
+        headers, digest, payload = self.cache.get(url, ({}, b"", None))
+        feed = feed_name(url)
+        with metrics.span("fetch_http", feed=feed):
+            response = self.session.get(url, headers=headers, timeout=timeout)
+
+        if response.status_code == 304 and payload is not None:
+            self.record(response, not_modified=True, same_body=False)
+            return payload
+
+        response.raise_for_status()
+        new_digest = hashlib.blake2b(response.content, digest_size=16).digest()
+        unchanged = new_digest == digest and payload is not None
+        self.record(response, not_modified=False, same_body=unchanged)
+        if not unchanged:
+            with metrics.span("parse", feed=feed):
+                payload = parse(response.content)
+
+        validators = {}
+        if "ETag" in response.headers:
+            validators["If-None-Match"] = response.headers["ETag"]
+        if "Last-Modified" in response.headers:
+            validators["If-Modified-Since"] = response.headers["Last-Modified"]
+        self.cache[url] = (validators, new_digest, payload)
+        return payload
+
+    def cached(self, url: str) -> Any:
+        """Get the payload last returned for a feed, if any."""
+        return self.cache[url][2] if url in self.cache else None
+
+    def record(
+        self, response: requests.Response, *, not_modified: bool, same_body: bool
+    ) -> None:
+        """Count a finished request."""
+        # tell() is what came over the wire, before any decompression
+        received = response.raw.tell() if response.raw else len(response.content)
+        with self.lock:
+            self.requests += 1
+            self.not_modified += not_modified
+            self.unchanged_bodies += same_body
+            self.bytes_received += received
+
+    def connections_opened(self) -> int:
+        """Count connections, and so TCP and TLS handshakes, made so far."""
+        pools = self.adapter.poolmanager.pools
+        return sum(pools[key].num_connections for key in pools.keys())
+
+    def stats(self) -> Dict[str, float]:
+        """Summarize the traffic sent through this session."""
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "not_modified": self.not_modified,
+                "not_modified_rate": (
+                    self.not_modified / self.requests if self.requests else 0.0
+                ),
+                "unchanged_bodies": self.unchanged_bodies,
+                "bytes_received": self.bytes_received,
+                "connections_opened": self.connections_opened(),
+            }
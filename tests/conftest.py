@@ -0,0 +1,52 @@
+"""Shared fixtures."""
+
+from typing import Any, Callable, Iterator
+
+import pytest
+
+from display_connector import epdconfig
+from display_connector.simulator import Simulated
+
+
+@pytest.fixture
+def install_platform(
+    monkeypatch: pytest.MonkeyPatch,
+) -> Iterator[Callable[[Any], None]]:
+    """Use the given object as the epdconfig platform, or None to start over.
+
+    With None, the next use of epdconfig creates the platform again, the way
+    it does on first use.
+    """
+    module_names = set(vars(epdconfig))
+
+    def unbind() -> None:
+        # get_implementation binds the platform's attributes onto the module
+        for name in set(vars(epdconfig)) - module_names:
+            delattr(epdconfig, name)
+
+    def install(platform: Any) -> None:
+        unbind()
+        monkeypatch.setattr(epdconfig, "implementation", platform)
+        monkeypatch.setattr(epdconfig, "selected_platform", None)
+
+    yield install
+    unbind()
+
+
+@pytest.fixture
+def new_simulator(
+    install_platform: Callable[[Any], None], monkeypatch: pytest.MonkeyPatch
+) -> Callable[[], Simulated]:
+    """Install a fresh simulated panel as the epdconfig platform on each call.
+
+    The simulator records a transcript of everything sent to it.
+    """
+
+    def install() -> Simulated:
+        install_platform(None)
+        monkeypatch.setattr(epdconfig, "selected_platform", "simulated")
+        simulator = epdconfig.get_implementation()
+        simulator.record_transcript = True
+        return simulator
+
+    return install
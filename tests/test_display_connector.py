@@ -0,0 +1,181 @@
+"""Tests of DisplayConnector on the simulated platform."""
+
+import threading
+from typing import Callable, Iterator, List
+
+import numpy
+import pytest
+
+from display_connector import DisplayConnector, frame, simulator
+from display_connector.simulator import Simulated
+
+# Seconds to wait on the writer thread before failing
+TIMEOUT = 5
+
+
+@pytest.fixture
+def panel(new_simulator: Callable[[], Simulated]) -> Simulated:
+    return new_simulator()
+
+
+@pytest.fixture
+def connector(panel: Simulated) -> Iterator[DisplayConnector]:
+    connector = DisplayConnector()
+    connector.init()
+    yield connector
+    connector.stop_writer()
+
+
+def test_writer_shows_only_the_newest_waiting_frame(
+    connector: DisplayConnector,
+) -> None:
+    written: List[str] = []
+    writing = threading.Event()
+    release = threading.Event()
+    done = threading.Event()
+
+    def slow_write() -> None:
+        writing.set()
+        release.wait(TIMEOUT)
+        written.append("first")
+
+    connector.submit(slow_write)
+    assert writing.wait(TIMEOUT)
+    # the writer is busy, so these wait in the mailbox and the newer one wins
+    connector.submit(lambda: written.append("second"))
+
+    def last_write() -> None:
+        written.append("third")
+        done.set()
+
+    connector.submit(last_write)
+    release.set()
+
+    assert done.wait(TIMEOUT)
+    assert written == ["first", "third"]
+    assert connector.refresh_stats()["dropped"] == 1
+
+
+def test_writer_keeps_going_after_a_failed_write(
+    connector: DisplayConnector,
+) -> None:
+    failing = threading.Event()
+    done = threading.Event()
+
+    def fail() -> None:
+        failing.set()
+        raise RuntimeError("panel went away")
+
+    connector.submit(fail)
+    assert failing.wait(TIMEOUT)
+    connector.submit(done.set)
+
+    assert done.wait(TIMEOUT)
+
+
+def test_writer_runs_again_after_cleanup_and_init(
+    connector: DisplayConnector,
+) -> None:
+    pixels = simulator.test_pattern(*simulator.DEFAULT_RESOLUTION)
+    done = threading.Event()
+
+    def write() -> None:
+        connector.display_pixels(pixels)
+        done.set()
+
+    connector.cleanup()
+    connector.init()
+    connector.submit(write)
+
+    assert done.wait(TIMEOUT)
+    assert connector.refresh_stats()["performed"] == 1
+    assert connector.writer is not None and connector.writer.is_alive()
+
+
+def test_stop_writer_drops_frames_still_waiting(
+    connector: DisplayConnector,
+) -> None:
+    written: List[str] = []
+    writing = threading.Event()
+    release = threading.Event()
+
+    def slow_write() -> None:
+        writing.set()
+        release.wait(TIMEOUT)
+        written.append("first")
+
+    connector.submit(slow_write)
+    assert writing.wait(TIMEOUT)
+    connector.submit(lambda: written.append("second"))
+    threading.Timer(0.05, release.set).start()
+    connector.stop_writer()
+
+    assert written == ["first"]
+    assert connector.writer is None
+
+
+@pytest.fixture
+def pixels() -> numpy.ndarray:
+    return simulator.test_pattern(*simulator.DEFAULT_RESOLUTION)
+
+
+def test_the_same_frame_is_refreshed_once(
+    panel: Simulated, connector: DisplayConnector, pixels: numpy.ndarray
+) -> None:
+    refreshes = panel.refreshes
+
+    assert connector.display_pixels(pixels)
+    assert not connector.display_pixels(pixels.copy())
+
+    assert panel.refreshes == refreshes + 1
+    stats = connector.refresh_stats()
+    assert stats["performed"] == 1
+    assert stats["skipped_unchanged"] == 1
+    assert stats["skipped_throttled"] == 0
+
+
+def test_a_new_frame_inside_the_interval_is_throttled(
+    panel: Simulated, connector: DisplayConnector, pixels: numpy.ndarray
+) -> None:
+    connector.min_refresh_interval = 3600
+    refreshes = panel.refreshes
+
+    assert connector.display_pixels(pixels)
+    assert not connector.display_pixels(pixels[::-1])
+
+    assert panel.refreshes == refreshes + 1
+    stats = connector.refresh_stats()
+    assert stats["performed"] == 1
+    assert stats["skipped_unchanged"] == 0
+    assert stats["skipped_throttled"] == 1
+
+
+def test_a_new_frame_after_the_interval_is_refreshed(
+    panel: Simulated,
+    connector: DisplayConnector,
+    pixels: numpy.ndarray,
+) -> None:
+    connector.min_refresh_interval = 60
+    assert connector.display_pixels(pixels)
+    assert connector.last_refresh_time is not None
+    connector.last_refresh_time -= 61
+
+    assert connector.display_pixels(pixels[::-1])
+    assert connector.refresh_stats()["performed"] == 2
+
+
+def test_a_frame_dithered_differently_is_not_unchanged(
+    panel: Simulated, connector: DisplayConnector, pixels: numpy.ndarray
+) -> None:
+    refreshes = panel.refreshes
+    connector.epd.dither = frame.Dither.ORDERED
+    assert connector.display_pixels(pixels)
+    ordered = panel.last_frame
+
+    connector.epd.dither = frame.Dither.NEAREST
+    assert connector.display_pixels(pixels)
+
+    assert panel.refreshes == refreshes + 2
+    assert connector.refresh_stats()["skipped_unchanged"] == 0
+    assert ordered is not None and panel.last_frame is not None
+    assert (panel.last_frame != ordered).any()
@@ -0,0 +1,187 @@
+"""Pixel checks of the cached drawing paths against drawing everything directly.
+
+These need pycairo and a font for the Sans family, and are skipped without
+pycairo.
+"""
+
+import pathlib
+import time
+from typing import Any, Callable, Dict, Iterator, List
+
+import pytest
+
+cairo = pytest.importorskip("cairo")
+draw = pytest.importorskip("draw")
+colors = pytest.importorskip("draw.colors")
+pencil = pytest.importorskip("draw.pencil")
+sprites = pytest.importorskip("draw.sprites")
+
+# Lines render_background draws between the stations
+DIVIDERS = (
+    (20, 240, 376, 240),
+    (424, 240, 750, 240),
+    (400, 28, 400, 216),
+    (400, 264, 400, 456),
+)
+
+
+def legacy_draw_text(
+    ctx: Any,
+    *,
+    text: str,
+    x: float,
+    y: float,
+    width: float | None = None,
+    height: float,
+    font_size: float,
+    color: tuple,
+    center: bool = False,
+) -> None:
+    """Draw text the way pencil.draw_text did before it cached fonts."""
+    ctx.select_font_face("Sans", cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_BOLD)
+    ctx.set_font_size(font_size)
+    ctx.set_source_rgb(*color)
+
+    text_extents = ctx.text_extents(text)
+    _width = width or 0
+    text_x = round(
+        x - (text_extents.width / 2 + text_extents.x_bearing) + _width / 2
+        if center
+        else x
+    )
+    text_y = round(y - (text_extents.height / 2 + text_extents.y_bearing) + height / 2)
+
+    ctx.move_to(text_x, text_y)
+    ctx.show_text(text)
+
+
+def render(paint: Callable[[Any], None], width: int = 320, height: int = 160) -> bytes:
+    """Draw onto a fresh board-colored surface and get its pixels."""
+    surface = cairo.ImageSurface(cairo.FORMAT_RGB24, width, height)
+    ctx = cairo.Context(surface)
+    ctx.set_source_rgb(*colors.NEUTRAL_100)
+    ctx.paint()
+    paint(ctx)
+    surface.flush()
+    return bytes(surface.get_data())
+
+
+@pytest.fixture
+def cache_dir(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> Iterator[pathlib.Path]:
+    monkeypatch.setattr(sprites, "CACHE_DIR", str(tmp_path))
+    sprites.get_minutes_atlas.cache_clear()
+    yield tmp_path
+    sprites.get_minutes_atlas.cache_clear()
+
+
+@pytest.mark.parametrize(
+    "text, font_size, center",
+    [
+        ("LEAVE", 16, True),
+        ("NOW", 16, True),
+        ("WAKEFIELD - 241ST", 16, False),
+        ("NEXT", 12, False),
+        ("2", 32, True),
+    ],
+)
+def test_draw_text_matches_uncached_fonts(
+    text: str, font_size: float, center: bool
+) -> None:
+    args = dict(
+        text=text,
+        x=20.4,
+        y=30.6,
+        width=64,
+        height=16,
+        font_size=font_size,
+        color=colors.NEUTRAL_900,
+        center=center,
+    )
+
+    expected = render(lambda ctx: legacy_draw_text(ctx, **args))
+    actual = render(lambda ctx: pencil.draw_text(ctx, **args))
+
+    assert actual == expected
+
+
+@pytest.mark.parametrize("font_size, suffix, height", [(84, "", 68), (16, " min.", 16)])
+@pytest.mark.parametrize("from_disk", [False, True])
+def test_minutes_atlas_matches_draw_text(
+    cache_dir: pathlib.Path,
+    font_size: float,
+    suffix: str,
+    height: float,
+    from_disk: bool,
+) -> None:
+    atlas = sprites.get_minutes_atlas(font_size, suffix)
+    if from_disk:
+        sprites.get_minutes_atlas.cache_clear()
+        atlas = sprites.get_minutes_atlas(font_size, suffix)
+
+    mismatched: List[str] = []
+    for text in sprites.minute_texts(suffix):
+        for x, y in ((12, 20), (33.4, 41.6)):
+            args = dict(x=x, y=y, height=height, color=colors.NEUTRAL_900)
+            expected = render(
+                lambda ctx: pencil.draw_text(
+                    ctx, text=text, font_size=font_size, **args
+                )
+            )
+            actual = render(lambda ctx: atlas.draw(ctx, text=text, **args))
+            if actual != expected:
+                mismatched.append(f"{text!r} at {x}, {y}")
+
+    assert not mismatched
+
+
+def test_board_matches_drawing_every_station_in_full(cache_dir: pathlib.Path) -> None:
+    now = int(time.time())
+    times = {
+        "N": {"2": [now + 700], "3": [], "B": [now + 600, now + 900], "Q": [now + 60]},
+        "S": {"2": [now + 1200], "3": [now + 300], "B": [], "Q": [now + 2400]},
+    }
+    alerts: Dict[str, Dict | None] = {
+        "2": None,
+        "3": {"header_text": {}},
+        "B": None,
+        "Q": None,
+    }
+
+    def draw_in_full(ctx: Any) -> None:
+        for station in draw.STATIONS:
+            draw.draw_station(
+                ctx,
+                x=station.x,
+                y=station.y,
+                station=station.name,
+                reverseDir=station.reverse_dir,
+                line=station.line,
+                status=(
+                    draw.Status.OK
+                    if alerts[station.route] is None
+                    else draw.Status.DELAYED
+                ),
+                times={"N": times["N"][station.route], "S": times["S"][station.route]},
+                walk_time=station.walk_time,
+            )
+        for x1, y1, x2, y2 in DIVIDERS:
+            pencil.draw_line(ctx, x1=x1, y1=y1, x2=x2, y2=y2, stroke=colors.NEUTRAL_200)
+
+    surface = draw.generate_subway_time_image(times, alerts)
+    surface.flush()
+
+    assert bytes(surface.get_data()) == render(draw_in_full, draw.WIDTH, draw.HEIGHT)
+
+
+@pytest.mark.parametrize("output_path", ["frame.png", "debug/frames/frame.png"])
+def test_save_subway_time_image(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch, output_path: str
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    surface = cairo.ImageSurface(cairo.FORMAT_RGB24, 8, 8)
+
+    draw.save_subway_time_image(surface, output_path)
+
+    assert (tmp_path / output_path).read_bytes().startswith(b"\x89PNG")
@@ -0,0 +1,151 @@
+"""Tests of the platform helpers in epdconfig."""
+
+import math
+import os
+import subprocess
+import sys
+import textwrap
+import time
+from typing import Any, Callable, List
+
+import pytest
+
+from display_connector import epdconfig
+from display_connector.simulator import Simulated
+
+# Run in a fresh interpreter, where epdconfig has not been imported yet
+IMPORT_CHECK = textwrap.dedent(
+    """
+    import sys
+
+    opened = []
+    sys.addaudithook(
+        lambda event, args: opened.append(str(args[0])) if event == "open" else None
+    )
+
+    from display_connector import epdconfig
+
+    hardware = [
+        path for path in opened if path.startswith(("/dev/", "/proc/", "/sys/"))
+    ]
+    assert not hardware, hardware
+    assert epdconfig.implementation is None
+    assert epdconfig.selected_platform is None
+    for module in ("spidev", "gpiozero", "Jetson", "Jetson.GPIO", "Hobot.GPIO"):
+        assert module not in sys.modules, module
+    """
+)
+
+
+class TimedGPIO:
+    """An RPi.GPIO style module whose pins all go high at a set time."""
+
+    RISING = 31
+
+    def __init__(self, rises_after: float) -> None:
+        self.rises_at = time.monotonic() + rises_after
+        self.edge_waits: List[int] = []
+
+    def input(self, pin: int) -> int:
+        return int(time.monotonic() >= self.rises_at)
+
+    def wait_for_edge(self, pin: int, edge: int, timeout: int) -> None:
+        assert edge == self.RISING
+        self.edge_waits.append(timeout)
+        time.sleep(max(0.0, min(timeout / 1000, self.rises_at - time.monotonic())))
+
+
+def test_wait_for_rising_edge_returns_once_the_pin_rises() -> None:
+    gpio = TimedGPIO(rises_after=0.25)
+    started = time.monotonic()
+
+    assert epdconfig.wait_for_rising_edge(gpio, 24, timeout=5)
+
+    assert 0.25 <= time.monotonic() - started < 1
+    # waits in slices, rather than handing the whole timeout to the module
+    assert len(gpio.edge_waits) >= 2
+    assert max(gpio.edge_waits) <= epdconfig.EDGE_WAIT_SLICE_MS
+
+
+def test_wait_for_rising_edge_skips_waiting_on_a_high_pin() -> None:
+    gpio = TimedGPIO(rises_after=0)
+
+    assert epdconfig.wait_for_rising_edge(gpio, 24, timeout=5)
+    assert gpio.edge_waits == []
+
+
+def test_wait_for_rising_edge_gives_up_at_the_timeout() -> None:
+    gpio = TimedGPIO(rises_after=math.inf)
+    started = time.monotonic()
+
+    assert not epdconfig.wait_for_rising_edge(gpio, 24, timeout=0.15)
+    assert 0.14 <= time.monotonic() - started < 1
+
+
+def test_importing_touches_no_hardware() -> None:
+    src = os.path.dirname(os.path.dirname(epdconfig.__file__))
+    env = {**os.environ, "PYTHONPATH": src}
+    env.pop(epdconfig.PLATFORM_ENV, None)
+
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_CHECK],
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+
+    assert result.returncode == 0, result.stderr
+
+
+@pytest.mark.parametrize(
+    "name, expected",
+    [
+        ("raspberrypi", epdconfig.RaspberryPi),
+        ("jetson", epdconfig.JetsonNano),
+        ("sunrise", epdconfig.SunriseX3),
+        ("simulated", Simulated),
+    ],
+)
+def test_platform_class(name: str, expected: type) -> None:
+    assert epdconfig.platform_class(name) is expected
+
+
+def test_platform_from_the_environment(
+    install_platform: Callable[[Any], None], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    install_platform(None)
+    monkeypatch.setenv(epdconfig.PLATFORM_ENV, "simulated")
+
+    assert isinstance(epdconfig.get_implementation(), Simulated)
+    assert epdconfig.selected_platform == "simulated"
+
+
+def test_selected_platform_wins_over_the_environment(
+    install_platform: Callable[[Any], None], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    install_platform(None)
+    monkeypatch.setenv(epdconfig.PLATFORM_ENV, "jetson")
+
+    epdconfig.select_platform("simulated")
+
+    assert isinstance(epdconfig.get_implementation(), Simulated)
+    # the platform in use can be selected again, but not swapped
+    epdconfig.select_platform("simulated")
+    with pytest.raises(RuntimeError):
+        epdconfig.select_platform("raspberrypi")
+
+
+def test_unknown_platforms_are_rejected(
+    install_platform: Callable[[Any], None], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    install_platform(None)
+
+    with pytest.raises(ValueError):
+        epdconfig.select_platform("arduino")
+    assert epdconfig.selected_platform is None
+
+    monkeypatch.setenv(epdconfig.PLATFORM_ENV, "arduino")
+    with pytest.raises(ValueError):
+        epdconfig.get_implementation()
+    assert epdconfig.implementation is None
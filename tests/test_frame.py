@@ -0,0 +1,110 @@
+"""Tests for the frame buffer helpers."""
+
+import threading
+from typing import Iterator, List
+
+import numpy
+import pytest
+
+from display_connector import frame
+
+
+def legacy_pack(indices: bytearray) -> List[int]:
+    """Pack nibbles the way EPD.getbuffer did before it used numpy."""
+    buf = [0x00] * (len(indices) // 2)
+    idx = 0
+    for i in range(0, len(indices), 2):
+        buf[idx] = (indices[i] << 4) + indices[i + 1]
+        idx += 1
+    return buf
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_pack_nibbles_matches_legacy_loop(seed: int) -> None:
+    rng = numpy.random.default_rng(seed)
+    indices = rng.integers(0, 16, 800 * 480, dtype=numpy.uint8).tobytes()
+
+    packed = frame.pack_nibbles(indices)
+
+    assert isinstance(packed, bytearray)
+    assert list(packed) == legacy_pack(bytearray(indices))
+
+
+def test_pack_nibbles_into_writes_the_same_bytes() -> None:
+    indices = numpy.arange(64, dtype=numpy.uint8) % 7
+    out = bytearray(32)
+
+    frame.pack_nibbles_into(indices, out)
+
+    assert out == frame.pack_nibbles(indices)
+
+
+@pytest.mark.parametrize("dither", list(frame.Dither))
+def test_panel_colors_map_to_their_own_index(dither: frame.Dither) -> None:
+    colors = frame.rgb_to_pixels(frame.PANEL_PALETTE.astype(numpy.uint8))
+    # 8x8 of each color, covering every cell of the Bayer matrix
+    pixels = numpy.repeat(colors, 8)[None, :].repeat(8, axis=0)
+
+    indices = frame.quantize(pixels, dither)
+
+    # the unused index 4 is black, which the panel shows as index 0
+    expected = [0 if i == 4 else i for i in range(len(frame.PANEL_PALETTE))]
+    assert (indices == numpy.repeat(expected, 8)[None, :]).all()
+
+
+@pytest.mark.parametrize("dither", list(frame.Dither))
+def test_quantize_is_deterministic(dither: frame.Dither) -> None:
+    rng = numpy.random.default_rng(0)
+    pixels = rng.integers(0, 1 << 24, (480, 800), dtype=numpy.uint32)
+
+    first = frame.quantize(pixels, dither)
+    second = frame.quantize(pixels.copy(), dither)
+
+    assert first.dtype == numpy.uint8
+    assert (first == second).all()
+
+
+def test_palette_luts_are_rebuilt_the_same() -> None:
+    nearest, ordered = frame.build_palette_luts()
+
+    assert (nearest == frame.NEAREST_LUT).all()
+    assert (ordered == frame.ORDERED_LUT).all()
+
+
+def test_read_ahead_reuses_one_thread() -> None:
+    read_ahead = frame.ReadAhead(depth=2)
+    threads = set()
+
+    def produce(count: int) -> Iterator[int]:
+        for item in range(count):
+            threads.add(threading.get_ident())
+            yield item
+
+    for count in (0, 1, 5, 20):
+        assert list(read_ahead(produce(count))) == list(range(count))
+
+    assert len(threads) == 1
+    assert threading.get_ident() not in threads
+
+
+def test_read_ahead_raises_producer_errors_and_recovers() -> None:
+    read_ahead = frame.ReadAhead()
+
+    def fail() -> Iterator[int]:
+        yield 1
+        raise ValueError("bad band")
+
+    with pytest.raises(ValueError, match="bad band"):
+        list(read_ahead(fail()))
+
+    assert list(read_ahead(iter(range(3)))) == [0, 1, 2]
+
+
+def test_read_ahead_drops_what_an_early_stop_left() -> None:
+    read_ahead = frame.ReadAhead(depth=2)
+
+    items = read_ahead(iter(range(100)))
+    assert next(items) == 0
+    items.close()
+
+    assert list(read_ahead(iter(range(1000, 1003)))) == [1000, 1001, 1002]
@@ -0,0 +1,291 @@
+"""Transcript tests of the panel driver on the simulated platform."""
+
+import logging
+import math
+import time
+from typing import Any, Callable, Iterator, List, Tuple
+
+import numpy
+import pytest
+
+from display_connector import epdconfig, frame, interface
+from display_connector.simulator import Simulated
+
+# (DC level, bytes sent in a row at that level)
+Stream = List[Tuple[int, bytes]]
+
+
+class LegacyEPD:
+    """The init, clear and sleep sequences of the driver as Waveshare ships it.
+
+    Every command and data byte goes out in its own SPI transfer, with its own
+    DC and CS toggles.
+    """
+
+    def __init__(self) -> None:
+        self.reset_pin = epdconfig.RST_PIN
+        self.dc_pin = epdconfig.DC_PIN
+        self.busy_pin = epdconfig.BUSY_PIN
+        self.cs_pin = epdconfig.CS_PIN
+        self.width = 800
+        self.height = 480
+
+    def reset(self) -> None:
+        epdconfig.digital_write(self.reset_pin, 1)
+        epdconfig.delay_ms(20)
+        epdconfig.digital_write(self.reset_pin, 0)
+        epdconfig.delay_ms(2)
+        epdconfig.digital_write(self.reset_pin, 1)
+        epdconfig.delay_ms(20)
+
+    def send_command(self, command: int) -> None:
+        epdconfig.digital_write(self.dc_pin, 0)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte([command])
+        epdconfig.digital_write(self.cs_pin, 1)
+
+    def send_data(self, data: int) -> None:
+        epdconfig.digital_write(self.dc_pin, 1)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte([data])
+        epdconfig.digital_write(self.cs_pin, 1)
+
+    def send_data2(self, data: List[int]) -> None:
+        epdconfig.digital_write(self.dc_pin, 1)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
+
+    def ReadBusyH(self) -> None:
+        while epdconfig.digital_read(self.busy_pin) == 0:
+            epdconfig.delay_ms(5)
+
+    def TurnOnDisplay(self) -> None:
+        self.send_command(0x04)
+        self.ReadBusyH()
+        self.send_command(0x12)
+        self.send_data(0x00)
+        self.ReadBusyH()
+        self.send_command(0x02)
+        self.send_data(0x00)
+        self.ReadBusyH()
+
+    def init(self) -> None:
+        epdconfig.module_init()
+        self.reset()
+        self.ReadBusyH()
+        epdconfig.delay_ms(30)
+        for command, *data in (
+            (0xAA, 0x49, 0x55, 0x20, 0x08, 0x09, 0x18),
+            (0x01, 0x3F),
+            (0x00, 0x5F, 0x69),
+            (0x03, 0x00, 0x54, 0x00, 0x44),
+            (0x05, 0x40, 0x1F, 0x1F, 0x2C),
+            (0x06, 0x6F, 0x1F, 0x17, 0x49),
+            (0x08, 0x6F, 0x1F, 0x1F, 0x22),
+            (0x30, 0x03),
+            (0x50, 0x3F),
+            (0x60, 0x02, 0x00),
+            (0x61, 0x03, 0x20, 0x01, 0xE0),
+            (0x84, 0x01),
+            (0xE3, 0x2F),
+        ):
+            self.send_command(command)
+            for byte in data:
+                self.send_data(byte)
+        self.send_command(0x04)
+        self.ReadBusyH()
+
+    def clear(self, color: int = 0x11) -> None:
+        self.send_command(0x10)
+        self.send_data2([color] * self.height * (self.width // 2))
+        self.TurnOnDisplay()
+
+    def sleep(self) -> None:
+        self.send_command(0x07)
+        self.send_data(0xA5)
+        epdconfig.delay_ms(2000)
+        epdconfig.module_exit()
+
+
+def spi_stream(simulator: Simulated) -> Stream:
+    """Get every byte sent, with the DC level it was sent at.
+
+    Also checks that every byte was sent while CS was held low.
+    """
+    runs: List[Tuple[int, bytearray]] = []
+    pins = {}
+    for _, event, details in simulator.transcript:
+        if event == "pin":
+            pin, value = details
+            pins[pin] = value
+        elif event == "spi":
+            dc, data = details
+            assert pins.get(simulator.CS_PIN) == 0, "SPI transfer with CS high"
+            if runs and runs[-1][0] == dc:
+                runs[-1][1].extend(data)
+            else:
+                runs.append((dc, bytearray(data)))
+    return [(dc, bytes(data)) for dc, data in runs]
+
+
+def reset_pulses(simulator: Simulated) -> List[Tuple[int, float]]:
+    """Get the levels written to the reset pin, with the time between them."""
+    writes = [
+        (clock, details[1])
+        for clock, event, details in simulator.transcript
+        if event == "pin" and details[0] == simulator.RST_PIN
+    ]
+    return [
+        (value, round(clock - writes[0][0], 6) if i else 0.0)
+        for i, (clock, value) in enumerate(writes)
+    ]
+
+
+def test_init_clear_and_sleep_send_the_legacy_byte_stream(
+    new_simulator: Callable[[], Simulated],
+) -> None:
+    legacy = new_simulator()
+    legacy_epd = LegacyEPD()
+    legacy_epd.init()
+    legacy_epd.clear()
+    legacy_epd.sleep()
+
+    simulator = new_simulator()
+    epd = interface.EPD()
+    epd.init()
+    epd.clear()
+    epd.sleep()
+
+    assert spi_stream(simulator) == spi_stream(legacy)
+    assert reset_pulses(simulator) == reset_pulses(legacy)
+    assert simulator.last_frame is not None and legacy.last_frame is not None
+    assert (simulator.last_frame == legacy.last_frame).all()
+
+
+def test_init_sends_each_command_and_its_data_in_one_transfer(
+    new_simulator: Callable[[], Simulated],
+) -> None:
+    legacy = new_simulator()
+    LegacyEPD().init()
+    simulator = new_simulator()
+    interface.EPD().init()
+
+    commands = len(interface.INIT_SEQUENCE)
+    data_bytes = sum(len(data) for _, data in interface.INIT_SEQUENCE)
+    # the register writes, then POWER_ON
+    assert legacy.spi_calls == commands + data_bytes + 1
+    assert simulator.spi_calls == 2 * commands + 1
+
+
+class PolledPanel:
+    """A platform without wait_busy_idle, whose BUSY pin rises at a set time."""
+
+    RST_PIN = 17
+    DC_PIN = 25
+    CS_PIN = 8
+    BUSY_PIN = 24
+
+    def __init__(self, idle_after: float) -> None:
+        self.idle_at = time.monotonic() + idle_after
+        self.delays = 0
+
+    def digital_read(self, pin: int) -> int:
+        assert pin == self.BUSY_PIN
+        return int(time.monotonic() >= self.idle_at)
+
+    def delay_ms(self, delaytime: float) -> None:
+        self.delays += 1
+        time.sleep(delaytime / 1000.0)
+
+
+def test_read_busy_waits_on_the_platform_until_idle(
+    new_simulator: Callable[[], Simulated],
+) -> None:
+    simulator = new_simulator()
+    simulator.start_busy(0x12)
+
+    interface.EPD().ReadBusyH("refresh")
+
+    assert simulator.clock == pytest.approx(simulator.busy_until)
+    assert simulator.digital_read(simulator.BUSY_PIN) == 1
+
+
+def test_read_busy_gives_up_at_the_timeout(
+    new_simulator: Callable[[], Simulated], caplog: pytest.LogCaptureFixture
+) -> None:
+    simulator = new_simulator()
+    simulator.start_busy(0x12)
+
+    with caplog.at_level(logging.WARNING, logger=interface.__name__):
+        interface.EPD().ReadBusyH("refresh", timeout=5)
+
+    assert simulator.clock == pytest.approx(5)
+    assert simulator.digital_read(simulator.BUSY_PIN) == 0
+    assert "refresh still busy" in caplog.text
+
+
+def test_read_busy_polls_platforms_without_edge_waits(
+    install_platform: Callable[[Any], None],
+) -> None:
+    panel = PolledPanel(idle_after=0.1)
+    install_platform(panel)
+    assert not hasattr(epdconfig, "wait_busy_idle")
+
+    elapsed = interface.EPD().ReadBusyH("refresh", timeout=5)
+
+    assert 0.1 <= elapsed < 1
+    assert panel.delays >= 2
+    assert panel.digital_read(panel.BUSY_PIN) == 1
+
+
+def test_read_busy_stops_polling_at_the_timeout(
+    install_platform: Callable[[Any], None], caplog: pytest.LogCaptureFixture
+) -> None:
+    panel = PolledPanel(idle_after=math.inf)
+    install_platform(panel)
+
+    with caplog.at_level(logging.WARNING, logger=interface.__name__):
+        elapsed = interface.EPD().ReadBusyH("refresh", timeout=0.1)
+
+    assert 0.1 <= elapsed < 1
+    assert "refresh still busy" in caplog.text
+
+
+@pytest.mark.parametrize("dither", list(frame.Dither))
+@pytest.mark.parametrize("height", [480, 3 * frame.BAND_ROWS + 20])
+def test_display_pixels_streams_the_same_bytes_as_packing_whole(
+    new_simulator: Callable[[], Simulated], dither: frame.Dither, height: int
+) -> None:
+    simulator = new_simulator()
+    rng = numpy.random.default_rng(height)
+    pixels = rng.integers(0, 1 << 24, (height, 800), dtype=numpy.uint32)
+    # some runs of exact panel colors, like the flat areas of a real frame
+    palette = frame.rgb_to_pixels(frame.PANEL_PALETTE.astype(numpy.uint8))
+    pixels[::3] = palette[rng.integers(0, len(palette), 800)]
+    epd = interface.EPD()
+    epd.dither = dither
+
+    epd.display_pixels(pixels)
+
+    assert bytes(simulator.registers[0x10]) == bytes(epd.getbuffer_pixels(pixels))
+
+
+def test_display_pixels_times_only_the_transfer(
+    new_simulator: Callable[[], Simulated],
+) -> None:
+    new_simulator()
+    epd = interface.EPD()
+    pack = epd.packer.pack
+
+    def slow_pack(*args: Any) -> Iterator[memoryview]:
+        for band in pack(*args):
+            time.sleep(0.02)
+            yield band
+
+    epd.packer.pack = slow_pack  # type: ignore[method-assign]
+    epd.display_pixels(numpy.zeros((480, 800), dtype=numpy.uint32))
+
+    assert epd.last_transfer["bytes"] == 480 * 800 // 2
+    # ten bands took at least 0.2s to pack, and none of it is counted
+    assert epd.last_transfer["seconds"] < 0.1
@@ -0,0 +1,66 @@
+"""Checks that driving the panel over and over does not keep allocating memory."""
+
+import threading
+import tracemalloc
+from typing import Callable, Iterator, List, Tuple
+
+import pytest
+
+from display_connector import interface, simulator
+from display_connector.simulator import Simulated
+
+CYCLES = 20
+
+# Bytes a run of cycles may end up holding, or peak at, beyond a single cycle
+SLACK = 16 * 1024
+
+
+@pytest.fixture
+def tracing() -> Iterator[None]:
+    tracemalloc.start()
+    yield
+    tracemalloc.stop()
+
+
+def traced_cycles(epd: interface.EPD, cycles: int) -> Tuple[int, int]:
+    """Display a frame and clear the panel a number of times.
+
+    Returns the traced memory in use afterwards, and its peak while running.
+    """
+    pixels = simulator.test_pattern(*simulator.DEFAULT_RESOLUTION)
+    tracemalloc.reset_peak()
+    for _ in range(cycles):
+        epd.display_pixels(pixels)
+        epd.clear()
+    return tracemalloc.get_traced_memory()
+
+
+def test_display_and_clear_hold_memory_flat(
+    new_simulator: Callable[[], Simulated],
+    tracing: None,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    panel = new_simulator()
+    panel.record_transcript = False
+    epd = interface.EPD()
+    epd.init()
+
+    # fill the solid frame cache and the simulator's registers first
+    traced_cycles(epd, 1)
+    current, peak = traced_cycles(epd, 1)
+
+    started: List[threading.Thread] = []
+    start = threading.Thread.start
+
+    def counted_start(thread: threading.Thread) -> None:
+        started.append(thread)
+        start(thread)
+
+    monkeypatch.setattr(threading.Thread, "start", counted_start)
+    current_after, peak_after = traced_cycles(epd, CYCLES)
+
+    assert panel.refreshes == 2 * (CYCLES + 2)
+    assert current_after - current < SLACK
+    assert peak_after - peak < SLACK
+    # the frame packer thread is started once and kept
+    assert started == []
@@ -0,0 +1,162 @@
+"""Tests of the wall-clock aligned fetch and render loops."""
+
+import asyncio
+import threading
+import time
+from typing import Dict, Iterator, List, Tuple
+
+import pytest
+
+import scheduler
+
+TIMES: scheduler.Times = {"N": {"2": [1_700_000_600]}, "S": {"2": []}}
+ALERTS: Dict = {"2": None}
+
+
+@pytest.mark.parametrize(
+    "now, tick",
+    [
+        (120.0, 180.0),
+        (120.5, 180.0),
+        (179.999, 180.0),
+        (0.0, 60.0),
+        (-1.0, 0.0),
+    ],
+)
+def test_next_tick_is_the_next_whole_interval(now: float, tick: float) -> None:
+    assert scheduler.next_tick(60, now=now) == pytest.approx(tick)
+
+
+@pytest.mark.parametrize(
+    "now, tick",
+    [
+        (100.0, 105.0),
+        (104.999, 105.0),
+        (105.0, 165.0),
+        (44.0, 45.0),
+    ],
+)
+def test_next_tick_with_an_offset(now: float, tick: float) -> None:
+    assert scheduler.next_tick(60, offset=-15, now=now) == pytest.approx(tick)
+
+
+@pytest.mark.parametrize("now", [0.0, 30.0, 44.9, 45.0, 59.0, 1_700_000_123.4])
+def test_fetch_ticks_lead_render_ticks(now: float) -> None:
+    lead = scheduler.FETCH_LEAD
+    fetch = scheduler.next_tick(60, -lead, now=now)
+
+    # every fetch tick falls the lead before a render tick, and the render
+    # tick after a fetch is the one it was fetching for
+    assert (fetch + lead) % 60 == pytest.approx(0)
+    assert scheduler.next_tick(60, now=fetch) == pytest.approx(fetch + lead)
+    assert 0 < fetch - now <= 60
+
+
+class Blocker:
+    """A fetch that blocks until released, and counts its calls."""
+
+    def __init__(self) -> None:
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.calls = 0
+
+    def fetch(self) -> Tuple[scheduler.Times, Dict]:
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        return TIMES, ALERTS
+
+
+@pytest.fixture
+def blocker() -> Iterator[Blocker]:
+    blocker = Blocker()
+    yield blocker
+    blocker.release.set()
+
+
+def make_scheduler(**kwargs: object) -> scheduler.Scheduler:
+    kwargs.setdefault("render", lambda *data: None)
+    return scheduler.Scheduler(**kwargs)  # type: ignore[arg-type]
+
+
+def test_failed_fetch_keeps_the_last_data() -> None:
+    def fail() -> Tuple[scheduler.Times, Dict]:
+        raise ConnectionError("feed down")
+
+    tasks = make_scheduler(fetch=fail)
+    tasks.store.update(TIMES, ALERTS)
+
+    asyncio.run(tasks.fetch_once(5))
+
+    assert tasks.store.data == (TIMES, ALERTS)
+    assert tasks.fetch_stats.overruns == 0
+
+
+def test_fetch_past_its_timeout_is_given_up(blocker: Blocker) -> None:
+    tasks = make_scheduler(fetch=blocker.fetch)
+    started = time.monotonic()
+
+    asyncio.run(tasks.fetch_once(0.1))
+
+    assert time.monotonic() - started < 1
+    assert blocker.calls == 1
+    assert tasks.store.data is None
+    assert tasks.fetch_stats.overruns == 1
+
+
+def test_hung_fetch_does_not_block_the_render(blocker: Blocker) -> None:
+    renders: List[Tuple] = []
+    tasks = make_scheduler(
+        fetch=blocker.fetch, render=lambda *data: renders.append(data)
+    )
+    tasks.store.update(TIMES, ALERTS)
+
+    async def fetch_and_render() -> bool:
+        fetching = asyncio.create_task(tasks.fetch_once(5))
+        await asyncio.to_thread(blocker.started.wait, 5)
+        await tasks.render_once(1)
+        still_fetching = not fetching.done()
+        blocker.release.set()
+        await fetching
+        return still_fetching
+
+    assert asyncio.run(fetch_and_render())
+    assert renders == [(TIMES, ALERTS)]
+
+
+def test_render_past_its_deadline_is_waited_for() -> None:
+    renders: List[Tuple] = []
+
+    def slow_render(*data: object) -> None:
+        time.sleep(0.2)
+        renders.append(data)
+
+    tasks = make_scheduler(render=slow_render)
+    tasks.store.update(TIMES, ALERTS)
+
+    asyncio.run(tasks.render_once(0.05))
+
+    assert renders == [(TIMES, ALERTS)]
+    assert tasks.render_stats.overruns == 1
+
+
+def test_failed_render_is_logged(caplog: pytest.LogCaptureFixture) -> None:
+    def fail(*data: object) -> None:
+        raise RuntimeError("no surface")
+
+    tasks = make_scheduler(render=fail)
+    tasks.store.update(TIMES, ALERTS)
+
+    asyncio.run(tasks.render_once(1))
+
+    assert "Render failed: no surface" in caplog.text
+    assert tasks.render_stats.overruns == 0
+
+
+def test_render_waits_for_the_first_fetch() -> None:
+    renders: List[Tuple] = []
+    tasks = make_scheduler(render=lambda *data: renders.append(data))
+
+    asyncio.run(tasks.render_once(1))
+
+    assert renders == []
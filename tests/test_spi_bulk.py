@@ -0,0 +1,53 @@
+"""Tests of the Jetson Nano's bulk SPI write shim."""
+
+import ctypes
+import pathlib
+import shutil
+from typing import List
+
+import pytest
+
+from display_connector import epdconfig, spi_bulk
+
+TRANSFER = ctypes.CFUNCTYPE(ctypes.c_uint8, ctypes.c_uint8)
+
+
+@pytest.mark.skipif(shutil.which("gcc") is None, reason="needs gcc")
+def test_spi_bulk_write_sends_every_byte_in_order(tmp_path: pathlib.Path) -> None:
+    path = spi_bulk.build(str(tmp_path))
+    assert path == str(tmp_path / epdconfig.SPI_BULK_LIBRARY)
+    library = ctypes.CDLL(path)
+    library.spi_bulk_write.argtypes = [
+        ctypes.c_void_p,
+        ctypes.c_void_p,
+        ctypes.c_uint32,
+    ]
+    library.spi_bulk_write.restype = None
+
+    sent: List[int] = []
+
+    @TRANSFER
+    def transfer(byte: int) -> int:
+        sent.append(byte)
+        return 0
+
+    data = bytearray(range(256)) * 3
+    buffer = (ctypes.c_uint8 * len(data)).from_buffer(data)
+
+    library.spi_bulk_write(ctypes.cast(transfer, ctypes.c_void_p), buffer, len(data))
+
+    assert bytes(sent) == bytes(data)
+
+
+def test_spi_library_dir_finds_the_spi_library(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    missing = tmp_path / "missing"
+    monkeypatch.setattr(epdconfig.JetsonNano, "LIBRARY_DIRS", [str(missing)])
+    assert spi_bulk.spi_library_dir() is None
+
+    (tmp_path / spi_bulk.SPI_LIBRARY).write_bytes(b"")
+    monkeypatch.setattr(
+        epdconfig.JetsonNano, "LIBRARY_DIRS", [str(missing), str(tmp_path)]
+    )
+    assert spi_bulk.spi_library_dir() == str(tmp_path)
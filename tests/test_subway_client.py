@@ -0,0 +1,179 @@
+"""Tests for the MTA feed client."""
+
+import threading
+from typing import Dict, List, Tuple
+
+import pytest
+from google.transit import gtfs_realtime_pb2
+
+import subway_client
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(subway_client, "_in_flight", {})
+    monkeypatch.setattr(subway_client, "_arrival_indexes", {})
+    monkeypatch.setattr(
+        subway_client,
+        "feed_stats",
+        {
+            url: {"polls": 0, "unchanged": 0, "still_running": 0}
+            for url in subway_client.feed_stats
+        },
+    )
+
+
+def test_submit_request_waits_on_a_request_still_running() -> None:
+    release = threading.Event()
+    url = subway_client.FEED_123
+
+    first = subway_client.submit_request(url, release.wait, 5)
+    again = subway_client.submit_request(url, release.wait, 5)
+    release.set()
+    first.result(timeout=5)
+    after = subway_client.submit_request(url, release.wait, 5)
+
+    assert again is first
+    assert after is not first
+    assert subway_client.feed_stats[url]["still_running"] == 1
+    after.result(timeout=5)
+
+
+def alert(*periods: dict) -> dict:
+    return {
+        "alert": {
+            "informed_entity": [{"agency_id": "MTASBWY", "route_id": "2"}],
+            "active_period": list(periods),
+        }
+    }
+
+
+@pytest.mark.parametrize(
+    "periods, active",
+    [
+        ((), True),
+        (({"start": 100, "end": 200},), True),
+        (({"start": 0, "end": 50}, {"start": 100, "end": 200}), True),
+        (({"start": 0, "end": 50}, {"start": 100}), True),
+        (({"start": 0, "end": 50}, {"start": 200, "end": 300}), False),
+    ],
+)
+def test_alert_index_checks_every_active_period(periods: tuple, active: bool) -> None:
+    index = subway_client.build_alert_index([alert(*periods)], now=150)
+
+    assert ("2" in index) is active
+
+
+def test_alert_without_active_periods_is_active() -> None:
+    entity = alert()
+    del entity["alert"]["active_period"]
+
+    assert subway_client.build_alert_index([entity], now=150) == {
+        "2": [entity["alert"]]
+    }
+
+
+NOW = 1_700_000_000
+
+
+def legacy_stop_times(
+    feed: gtfs_realtime_pb2.FeedMessage, stop_id: str, route_id: str, now: int
+) -> List[int]:
+    """Scan a feed the way get_subway_data_for_stop did before the index."""
+    times = []
+    for entity in feed.entity:
+        if (
+            entity.HasField("trip_update")
+            and entity.trip_update.stop_time_update
+            and entity.trip_update.trip.route_id == route_id
+        ):
+            for stop_time_update in entity.trip_update.stop_time_update:
+                departure_time = stop_time_update.departure.time
+                if stop_time_update.stop_id == stop_id and departure_time > now:
+                    times.append(departure_time)
+    times.sort()
+    return times
+
+
+def make_feed(
+    timestamp: int, trips: Dict[str, List[Dict[str, int]]]
+) -> gtfs_realtime_pb2.FeedMessage:
+    """Build a feed from route ID -> one {stop ID: departure} per trip."""
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.header.gtfs_realtime_version = "2.0"
+    feed.header.timestamp = timestamp
+    for route_id, route_trips in trips.items():
+        for number, stops in enumerate(route_trips):
+            entity = feed.entity.add(id=f"{route_id}-{number}")
+            entity.trip_update.trip.route_id = route_id
+            for stop_id, departure in stops.items():
+                update = entity.trip_update.stop_time_update.add(stop_id=stop_id)
+                update.departure.time = departure
+    # entities without a trip update, such as vehicle positions, are skipped
+    feed.entity.add(id="vehicle").vehicle.trip.route_id = "2"
+    return feed
+
+
+FEED = make_feed(
+    NOW,
+    {
+        "2": [
+            {"231N": NOW + 600, "231S": NOW - 60},
+            {"231N": NOW, "231S": NOW + 1},
+            {"231N": NOW + 120, "232N": NOW + 180},
+            {},
+        ],
+        # shares a stop with the 2
+        "3": [{"231N": NOW + 300}, {"231N": NOW + 60, "231S": NOW + 900}],
+        "B": [{"D24S": NOW + 30}],
+    },
+)
+
+# (stop ID, route ID) pairs asked for, including ones with no trips
+STOPS: List[Tuple[str, str]] = [
+    ("231N", "2"),
+    ("231S", "2"),
+    ("231N", "3"),
+    ("231S", "3"),
+    ("D24S", "B"),
+    ("D24N", "B"),
+    ("R30N", "Q"),
+]
+
+
+@pytest.mark.parametrize("now", [NOW - 120, NOW, NOW + 1, NOW + 600, NOW + 1000])
+def test_arrival_index_matches_the_linear_scan(now: int) -> None:
+    index = subway_client.build_arrival_index(FEED, STOPS)
+
+    for stop_id, route_id in STOPS:
+        assert subway_client.upcoming_departures(
+            index, stop_id, route_id, now
+        ) == legacy_stop_times(FEED, stop_id, route_id, now), (stop_id, route_id)
+
+
+def test_departure_at_now_has_left() -> None:
+    index = subway_client.build_arrival_index(FEED, STOPS)
+
+    assert subway_client.upcoming_departures(index, "231N", "2", NOW) == [
+        NOW + 120,
+        NOW + 600,
+    ]
+    assert subway_client.upcoming_departures(index, "R30N", "Q", NOW) == []
+    assert subway_client.upcoming_departures(index, "999N", "2", NOW) == []
+
+
+def test_arrival_index_is_rebuilt_when_the_feed_moves_on() -> None:
+    url = subway_client.FEED_123
+    stops = [("231N", "2")]
+    first = subway_client.get_arrival_index(url, FEED, stops)
+
+    same_timestamp = make_feed(NOW, {"2": [{"231N": NOW + 60}]})
+    assert subway_client.get_arrival_index(url, same_timestamp, stops) is first
+    assert subway_client.get_arrival_index(url, FEED, stops) is first
+
+    newer = make_feed(NOW + 30, {"2": [{"231N": NOW + 60}]})
+    rebuilt = subway_client.get_arrival_index(url, newer, stops)
+
+    assert rebuilt[("231N", "2")] == (NOW + 60,)
+    assert subway_client.feed_stats[url]["polls"] == 4
+    assert subway_client.feed_stats[url]["unchanged"] == 2